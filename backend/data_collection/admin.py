@@ -1,6 +1,7 @@
 from django.contrib import admin
 
-from .models import Location, ProcessedData, RawData
+from .models import (Location, LocationFeatures, OpenAQStationCache,
+                     ProcessedData, RawData)
 
 
 @admin.register(RawData)
@@ -23,9 +24,23 @@ class ProcessedDataAdmin(admin.ModelAdmin):
         return queryset.prefetch_related('raw_data')
 
 
+@admin.register(LocationFeatures)
+class LocationFeaturesAdmin(admin.ModelAdmin):
+    list_display = ('location', 'timestamp', 'temperature', 'pm25', 'pm10')
+    list_filter = ('location',)
+    search_fields = ('location',)
+    date_hierarchy = 'timestamp'
+
+
 @admin.register(Location)
 class LocationAdmin(admin.ModelAdmin):
     list_display = ('name', 'city', 'country', 'latitude', 'longitude', 'is_active', 'created_at')
     list_filter = ('country', 'is_active')
     search_fields = ('name', 'city', 'country')
-    list_editable = ('is_active',)
\ No newline at end of file
+    list_editable = ('is_active',)
+
+
+@admin.register(OpenAQStationCache)
+class OpenAQStationCacheAdmin(admin.ModelAdmin):
+    list_display = ('location', 'fetched_at')
+    search_fields = ('location__name',)
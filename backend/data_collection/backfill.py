@@ -0,0 +1,424 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, time, timedelta
+from datetime import timezone as dt_timezone
+from time import sleep
+
+from django.conf import settings
+from django.db import transaction
+from loguru import logger
+
+from data_collection.kafka.http_client import ProviderClient
+from data_collection.kafka.openaq_cache import StationCache
+from data_collection.kafka.outbox import enqueue_raw_data
+from data_collection.kafka.processor import KafkaProcessor
+from data_collection.kafka.sharding import LocationSharder
+from data_collection.models import BackfillCheckpoint, Location, RawData
+
+
+def to_current_weather(point):
+    """Convert a One Call timemachine data point to the /weather payload
+    shape."""
+    weather = {
+        'dt': point.get('dt'),
+        'main': {
+            'temp': point['temp'],
+            'feels_like': point.get('feels_like', point['temp']),
+            'humidity': point['humidity'],
+            'pressure': point['pressure'],
+        },
+        'wind': {
+            'speed': point.get('wind_speed', 0),
+            'deg': point.get('wind_deg', 0),
+        },
+        'clouds': {'all': point.get('clouds', 0)},
+        'weather': point.get('weather') or [{'main': '', 'description': ''}],
+    }
+    for key in ('rain', 'snow'):
+        if key in point:
+            weather[key] = point[key]
+    return weather
+
+
+def day_runs(days):
+    """Split sorted dates into runs of consecutive days, as (first, last)."""
+    runs = []
+    for day in days:
+        if runs and day - runs[-1][1] == timedelta(days=1):
+            runs[-1][1] = day
+        else:
+            runs.append([day, day])
+    return [tuple(run) for run in runs]
+
+
+class HistoryBackfiller:
+    """
+    Backfills daily weather and pollution history for locations.
+
+    Date ranges are split in chunks fetched in parallel. The backfill
+    registers as a collector group member reserving its request rates,
+    which the live collectors take off their own limits while it runs, so
+    the total rate sent to each provider does not grow. The days stored for
+    a chunk are recorded in BackfillCheckpoint within the same transaction,
+    so an interrupted run resumes where it stopped; days without data are
+    not recorded and are tried again by the next run.
+
+    Sinks:
+    - ``db``: bulk insert RawData and upsert ProcessedData directly (history
+      is not sent through Kafka, so no predictions are made for it).
+    - ``topic``: insert RawData through the outbox so the history goes
+      through the raw topic. The messages are flagged as backfill: the
+      processor stores them without touching the live join state or
+      forwarding them to the prediction topic.
+    """
+
+    SINKS = ('db', 'topic')
+
+    def __init__(self, sink='db', chunk_days=None, workers=None):
+        if sink not in self.SINKS:
+            raise ValueError(f"Unknown backfill sink: {sink}")
+
+        self.sink = sink
+        self.chunk_days = chunk_days or settings.BACKFILL_CHUNK_DAYS
+        self.workers = workers or settings.BACKFILL_WORKERS
+
+        openaq_headers = {}
+        if settings.OPENAQ_API_KEY:
+            openaq_headers['X-API-Key'] = settings.OPENAQ_API_KEY
+
+        self.openweather = ProviderClient(
+            'openweather-history',
+            'https://api.openweathermap.org/data/3.0',
+            rate=settings.BACKFILL_OPENWEATHER_RATE_LIMIT,
+            burst=1,
+            pool_size=self.workers,
+        )
+        self.openaq = ProviderClient(
+            'openaq-history',
+            'https://api.openaq.org/v3',
+            rate=settings.BACKFILL_OPENAQ_RATE_LIMIT,
+            burst=1,
+            pool_size=self.workers,
+            headers=openaq_headers,
+        )
+
+        # Taken from the live collectors' rates while the backfill runs
+        reserved_rates = {
+            'openweather': settings.BACKFILL_OPENWEATHER_RATE_LIMIT,
+            'openaq': settings.BACKFILL_OPENAQ_RATE_LIMIT,
+        }
+        live_rates = {
+            'openweather': settings.OPENWEATHER_RATE_LIMIT,
+            'openaq': settings.OPENAQ_RATE_LIMIT,
+        }
+        for provider, rate in reserved_rates.items():
+            if rate >= live_rates[provider]:
+                raise ValueError(
+                    f"The {provider} backfill rate ({rate}/s) must be below "
+                    f"the live rate ({live_rates[provider]}/s)"
+                )
+        self.sharder = LocationSharder(
+            role='backfill', reserved_rates=reserved_rates
+        )
+
+        self.station_cache = StationCache()
+        self.station_cache.load()
+
+    def pending_chunks(self, location, start, end):
+        """Split the days of [start, end] not yet backfilled into chunks of
+        consecutive days."""
+        covered = set()
+        checkpoints = BackfillCheckpoint.objects.filter(
+            location=location, end_date__gte=start, start_date__lte=end
+        )
+        for checkpoint in checkpoints:
+            day = checkpoint.start_date
+            while day <= checkpoint.end_date:
+                covered.add(day)
+                day += timedelta(days=1)
+
+        chunks = []
+        chunk_start = None
+        day = start
+        while day <= end:
+            if day in covered:
+                if chunk_start:
+                    chunks.append((chunk_start, day - timedelta(days=1)))
+                    chunk_start = None
+            elif chunk_start is None:
+                chunk_start = day
+            elif (day - chunk_start).days >= self.chunk_days:
+                chunks.append((chunk_start, day - timedelta(days=1)))
+                chunk_start = day
+            day += timedelta(days=1)
+
+        if chunk_start:
+            chunks.append((chunk_start, end))
+        return chunks
+
+    def discover_stations(self, location):
+        """Return the OpenAQ stations around a location, using the shared
+        station cache."""
+        stations = self.station_cache.get(location)
+        if stations is None:
+            stations_data = self.openaq.get(
+                '/locations',
+                params={
+                    'coordinates': f"{location.latitude},{location.longitude}",
+                    'radius': 10000,
+                    'limit': 5,
+                    'sort': 'asc'
+                },
+                endpoint='locations'
+            )
+            stations = self.station_cache.set(
+                location, stations_data.get('results') or []
+            )
+            self.station_cache.save()
+        return stations
+
+    def fetch_weather(self, location, day):
+        """Fetch the weather at noon UTC on a given day."""
+        moment = datetime.combine(day, time(12), tzinfo=dt_timezone.utc)
+        data = self.openweather.get(
+            '/onecall/timemachine',
+            params={
+                'lat': location.latitude,
+                'lon': location.longitude,
+                'dt': int(moment.timestamp()),
+                'appid': settings.OPENWEATHER_API_KEY,
+                'units': 'metric'
+            },
+            endpoint='timemachine'
+        )
+        points = data.get('data') or []
+        return to_current_weather(points[0]) if points else None
+
+    def fetch_pollution(self, stations, start, end):
+        """Fetch daily sensor measurements for [start, end], grouped by day."""
+        by_day = {}
+        seen_params = set()
+
+        for station in stations:
+            for sensor in station.get('sensors', []):
+                param_name = sensor.get('parameter', {}).get('name')
+                if param_name in seen_params:
+                    continue
+
+                day_after = end + timedelta(days=1)
+                sensor_data = self.openaq.get(
+                    f"/sensors/{sensor['id']}/measurements/daily",
+                    params={
+                        'datetime_from': f"{start.isoformat()}T00:00:00Z",
+                        'datetime_to': f"{day_after.isoformat()}T00:00:00Z",
+                        'limit': 1000
+                    },
+                    endpoint='measurements'
+                )
+
+                results = sensor_data.get('results') or []
+                for measurement in results:
+                    period_start = measurement.get('period', {}).get(
+                        'datetimeFrom', {}
+                    )
+                    day = (
+                        period_start.get('local') or
+                        period_start.get('utc') or ''
+                    )[:10]
+                    if day:
+                        by_day.setdefault(day, []).append(measurement)
+                if results:
+                    seen_params.add(param_name)
+
+            if len(seen_params) >= 5:
+                break
+
+        return by_day
+
+    def fetch_chunk(self, location, stations, start, end):
+        """Return (day, weather, measurements) for each day of the chunk
+        that has both."""
+        pollution = self.fetch_pollution(stations, start, end)
+
+        days = []
+        day = start
+        while day <= end:
+            measurements = pollution.get(day.isoformat())
+            if measurements:
+                weather = self.fetch_weather(location, day)
+                if weather:
+                    days.append((day, weather, measurements))
+            day += timedelta(days=1)
+        return days
+
+    def store_chunk(self, location, days):
+        """Write the fetched days of a chunk and checkpoint them atomically."""
+        with transaction.atomic():
+            raw_rows = []
+            for day, weather, measurements in days:
+                timestamp = datetime.combine(
+                    day, time(12), tzinfo=dt_timezone.utc
+                )
+                sources = (('openweather', weather), ('openaq', measurements))
+                for source, data in sources:
+                    raw_rows.append(RawData(
+                        source=source,
+                        data=data,
+                        location=location.name,
+                        latitude=location.latitude,
+                        longitude=location.longitude,
+                        timestamp=timestamp
+                    ))
+
+            if self.sink == 'topic':
+                enqueue_raw_data(raw_rows, backfill=True)
+            else:
+                self.store_processed(
+                    location, RawData.objects.bulk_create(raw_rows)
+                )
+
+            # Only the days stored: the others are retried by the next run
+            BackfillCheckpoint.objects.bulk_create([
+                BackfillCheckpoint(
+                    location=location,
+                    start_date=first,
+                    end_date=last,
+                    sink=self.sink,
+                    records=(last - first).days + 1
+                )
+                for first, last in day_runs([day for day, _, _ in days])
+            ])
+
+    def store_processed(self, location, raw_rows):
+        """Merge each day's weather and pollution rows into ProcessedData
+        with bulk upserts."""
+        records = []
+        message = {
+            'location': location.name,
+            'latitude': location.latitude,
+            'longitude': location.longitude,
+        }
+
+        # Rows come in (openweather, openaq) pairs, one pair per day
+        for weather_row, pollution_row in zip(raw_rows[::2], raw_rows[1::2]):
+            merged = KafkaProcessor.merge_data(
+                KafkaProcessor.process_openweather_data(
+                    {**message, 'data': weather_row.data}
+                ),
+                KafkaProcessor.process_openaq_data(
+                    {**message, 'data': pollution_row.data}
+                ),
+                location.name
+            )
+            if not merged:
+                continue
+
+            merged['timestamp'] = weather_row.timestamp.isoformat()
+            merged['latitude'] = location.latitude
+            merged['longitude'] = location.longitude
+            records.append((merged, [weather_row.id, pollution_row.id]))
+
+        if records:
+            KafkaProcessor.store_processed_batch(records)
+
+    def backfill(self, locations, start, end):
+        """Backfill [start, end] for the given locations. Returns the number
+        of days stored."""
+        self.claim()
+        try:
+            if self.sharder.live_instances().filter(role='collector').exists():
+                # Let the collectors lower their rates before sending requests
+                wait = settings.COLLECTOR_LOCATION_REFRESH_INTERVAL
+                logger.info(
+                    f"Waiting {wait} seconds for the collectors to apply "
+                    f"the backfill rates"
+                )
+                sleep(wait)
+            return self._backfill(locations, start, end)
+        finally:
+            self.sharder.stop()
+
+    def claim(self):
+        """Register this backfill and its reserved rates, unless another
+        backfill is running.
+
+        The check and the registration happen in one transaction holding the
+        row locks every backfill takes first, so two concurrent runs cannot
+        both pass the check.
+        """
+        with transaction.atomic():
+            # A fresh database has no checkpoint to lock yet, but the
+            # locations to backfill always exist
+            list(
+                Location.objects.select_for_update()
+                .order_by('pk').values_list('pk', flat=True)
+            )
+            list(
+                BackfillCheckpoint.objects.select_for_update()
+                .order_by('pk').values_list('pk', flat=True)
+            )
+            if self.sharder.reserved_rates_total():
+                raise RuntimeError("Another history backfill is running")
+            self.sharder.start()
+
+    def _backfill(self, locations, start, end):
+        jobs = []
+        for location in locations:
+            try:
+                stations = self.discover_stations(location)
+            except Exception as e:
+                logger.error(
+                    "Error discovering OpenAQ stations for "
+                    f"{location.name}: {e}"
+                )
+                continue
+
+            if not stations:
+                logger.warning(
+                    f"No OpenAQ station near {location.name}, skipping"
+                )
+                continue
+
+            for chunk in self.pending_chunks(location, start, end):
+                jobs.append((location, stations, chunk))
+
+        logger.info(
+            f"Backfilling {len(jobs)} chunks for {len(locations)} locations "
+            f"from {start} to {end}"
+        )
+
+        stored = 0
+        failed = 0
+        with ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix='backfill'
+        ) as executor:
+            futures = {
+                executor.submit(self.fetch_chunk, location, stations, *chunk):
+                    (location, chunk)
+                for location, stations, chunk in jobs
+            }
+
+            for future in as_completed(futures):
+                location, (chunk_start, chunk_end) = futures[future]
+                try:
+                    days = future.result()
+                    self.store_chunk(location, days)
+                except Exception as e:
+                    logger.error(
+                        f"Error backfilling {location.name} from "
+                        f"{chunk_start} to {chunk_end}: {e}"
+                    )
+                    failed += 1
+                    continue
+
+                stored += len(days)
+                missing = (chunk_end - chunk_start).days + 1 - len(days)
+                logger.info(
+                    f"Backfilled {len(days)} days for {location.name} "
+                    f"from {chunk_start} to {chunk_end} "
+                    f"({missing} days without data, retried by the next run)"
+                )
+
+        logger.info(
+            f"Backfill complete: {stored} days stored, {failed} chunks failed"
+        )
+        return stored
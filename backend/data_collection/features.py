@@ -0,0 +1,108 @@
+from itertools import islice
+
+import numpy as np
+
+# Model features in their fixed column order, with where they come from in the
+# merged data and the value used when a reading is missing
+FEATURES = (
+    ('temperature', 'weather', 'temperature', 20),
+    ('humidity', 'weather', 'humidity', 50),
+    ('wind_speed', 'weather', 'wind_speed', 5),
+    ('pressure', 'weather', 'pressure', 1013),
+    ('cloud_cover', 'weather', 'clouds', 0),
+    ('pm25', 'pollution', 'pm25', 10),
+    ('pm10', 'pollution', 'pm10', 20),
+    ('o3', 'pollution', 'o3', 30),
+    ('no2', 'pollution', 'no2', 10),
+    ('so2', 'pollution', 'so2', 5),
+    ('co', 'pollution', 'co', 0.5),
+)
+
+FEATURE_COLUMNS = tuple(name for name, _, _, _ in FEATURES)
+FEATURE_DEFAULTS = np.array(
+    [default for _, _, _, default in FEATURES], dtype=float
+)
+
+
+def record_sections(merged):
+    """Weather and pollution readings of a merged record, keyed by
+    section."""
+    return {
+        'weather': merged.get('weather') or {},
+        'pollution': merged.get('pollution') or {},
+    }
+
+
+def feature_frame(records):
+    """Features of merged records as a (records, FEATURE_COLUMNS) array.
+
+    The array is allocated once for the whole batch and filled in place.
+    """
+    frame = np.empty((len(records), len(FEATURES)))
+    frame[:] = FEATURE_DEFAULTS
+
+    for i, merged in enumerate(records):
+        sections = record_sections(merged)
+        row = frame[i]
+        for j, (_, section, key, _) in enumerate(FEATURES):
+            value = sections[section].get(key)
+            if value is not None:
+                row[j] = value
+
+    return frame
+
+
+def feature_values(merged):
+    """Values of FEATURE_COLUMNS in a merged record, None where a reading is
+    missing."""
+    sections = record_sections(merged)
+    return [sections[section].get(key) for _, section, key, _ in FEATURES]
+
+
+def fill_defaults(frame):
+    """Replace the missing values (NaN) of a FEATURE_COLUMNS array by their
+    defaults, in place."""
+    missing = np.isnan(frame)
+    if missing.any():
+        defaults = np.broadcast_to(FEATURE_DEFAULTS, frame.shape)
+        frame[missing] = defaults[missing]
+    return frame
+
+
+def read_frame(rows, count, chunk_size, dtype=np.float32):
+    """Read tuples of FEATURE_COLUMNS values (None if missing) into an array.
+
+    The array is allocated once for ``count`` rows and filled ``chunk_size``
+    rows at a time, so only one chunk of Python tuples is alive at once.
+    Reads at most ``count`` rows; fewer if ``rows`` ends earlier.
+    """
+    frame = np.empty((count, len(FEATURES)), dtype=dtype)
+    rows = iter(rows)
+    filled = 0
+    while filled < count:
+        chunk = list(islice(rows, min(chunk_size, count - filled)))
+        if not chunk:
+            break
+        frame[filled:filled + len(chunk)] = np.array(chunk, dtype=dtype)
+        filled += len(chunk)
+    return frame[:filled]
+
+
+def align_frame(features, columns):
+    """Reorder a feature array written with other columns to FEATURE_COLUMNS.
+
+    Features unknown to the writer get their default value.
+    """
+    columns = list(columns)
+    features = np.asarray(features, dtype=float).reshape(
+        -1, len(columns) or len(FEATURES)
+    )
+    if columns == list(FEATURE_COLUMNS):
+        return features
+
+    frame = np.empty((len(features), len(FEATURES)))
+    frame[:] = FEATURE_DEFAULTS
+    for j, name in enumerate(FEATURE_COLUMNS):
+        if name in columns:
+            frame[:, j] = features[:, columns.index(name)]
+    return frame
@@ -0,0 +1,106 @@
+import json
+import threading
+
+from confluent_kafka import Producer
+from django.conf import settings
+from loguru import logger
+
+
+def producer_config(client_id, profile=None):
+    """Build the confluent_kafka producer configuration for a profile."""
+    profile = profile or settings.KAFKA_PRODUCER_PROFILE
+    config = {
+        'bootstrap.servers': settings.KAFKA_BOOTSTRAP_SERVERS,
+        'client.id': client_id,
+    }
+
+    if profile == 'throughput':
+        config.update({
+            'linger.ms': settings.KAFKA_PRODUCER_LINGER_MS,
+            'batch.size': settings.KAFKA_PRODUCER_BATCH_SIZE,
+            'compression.type': settings.KAFKA_PRODUCER_COMPRESSION,
+            'enable.idempotence': settings.KAFKA_PRODUCER_IDEMPOTENCE,
+        })
+    elif profile != 'default':
+        raise ValueError(f"Unknown Kafka producer profile: {profile}")
+
+    if settings.KAFKA_STATS_INTERVAL_MS:
+        config['statistics.interval.ms'] = settings.KAFKA_STATS_INTERVAL_MS
+
+    return config
+
+
+class ProducerStats:
+    """
+    Keeps the last librdkafka statistics of a producer and logs a summary.
+    """
+
+    def __init__(self, client_id):
+        self.client_id = client_id
+        self.summary = {}
+
+    def __call__(self, stats_json):
+        stats = json.loads(stats_json)
+
+        rtts = [
+            broker['rtt']['avg']
+            for broker in stats.get('brokers', {}).values()
+            if broker.get('rtt', {}).get('avg')
+        ]
+        batch_sizes = [
+            topic['batchsize']['avg']
+            for topic in stats.get('topics', {}).values()
+            if topic.get('batchsize', {}).get('avg')
+        ]
+
+        self.summary = {
+            'queue_depth': stats.get('msg_cnt', 0),
+            'queue_bytes': stats.get('msg_size', 0),
+            'messages_sent': stats.get('txmsgs', 0),
+            'avg_batch_size': (
+                sum(batch_sizes) / len(batch_sizes) if batch_sizes else 0
+            ),
+            'avg_rtt_ms': sum(rtts) / len(rtts) / 1000 if rtts else 0,
+        }
+        logger.info(f"Kafka producer {self.client_id} stats: {self.summary}")
+
+
+class ProducerPoller:
+    """
+    Background thread serving a producer's delivery callbacks, so the
+    caller never has to block on flush() to get them.
+    """
+
+    def __init__(self, producer, interval=0.1):
+        self.producer = producer
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(
+            target=self._loop, name='kafka-producer-poll', daemon=True
+        )
+
+    def _loop(self):
+        while not self.stop_event.is_set():
+            self.producer.poll(self.interval)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self, flush_timeout=10):
+        """Stop polling and wait for the messages still in the queue."""
+        self.stop_event.set()
+        self.thread.join()
+        return self.producer.flush(flush_timeout)
+
+
+def build_producer(client_id, profile=None, **overrides):
+    """Create a producer for the configured profile. Returns the producer
+    and its ProducerStats."""
+    stats = ProducerStats(client_id)
+    config = producer_config(client_id, profile)
+    config['stats_cb'] = stats
+    config.update(overrides)
+
+    producer = Producer(config)
+    return producer, stats
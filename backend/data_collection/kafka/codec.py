@@ -0,0 +1,224 @@
+import json
+import time
+from dataclasses import dataclass
+
+import msgpack
+from django.conf import settings
+from loguru import logger
+
+from data_collection.features import FEATURE_COLUMNS, feature_frame
+
+# First byte of binary messages. JSON messages always start with '{', so both
+# formats can be told apart while producers are being switched over.
+MAGIC_BYTE = 0x00
+
+
+@dataclass(frozen=True)
+class Field:
+    name: str
+    # Values are cast to this type when set; None keeps them as they are
+    type: type = None
+
+
+@dataclass(frozen=True)
+class Schema:
+    """
+    Versioned message schema. Binary messages are encoded as a msgpack array
+    of the field values in schema order, prefixed by the magic byte and the
+    schema version.
+    """
+    name: str
+    version: int
+    fields: tuple
+
+    def to_values(self, message):
+        values = []
+        for field in self.fields:
+            value = message.get(field.name)
+            if value is not None and field.type is not None:
+                value = field.type(value)
+            values.append(value)
+        return values
+
+    def to_message(self, values):
+        return {field.name: value for field, value in zip(self.fields, values)}
+
+
+RAW_SCHEMA_V1 = Schema('raw', 1, (
+    Field('id', int),
+    Field('source', str),
+    Field('location', str),
+    Field('latitude', float),
+    Field('longitude', float),
+    Field('timestamp', str),
+    Field('data'),
+))
+
+# Version 2 flags the history readings sent by the backfill
+RAW_SCHEMA = Schema('raw', 2, RAW_SCHEMA_V1.fields + (
+    Field('backfill', bool),
+))
+
+# One message per merged record, written before micro-batch frames
+PROCESSED_RECORD_SCHEMA = Schema('processed', 1, (
+    Field('id', int),
+    Field('location', str),
+    Field('latitude', float),
+    Field('longitude', float),
+    Field('timestamp', str),
+    Field('weather'),
+    Field('pollution'),
+))
+
+# One message per micro-batch: the records' ids and metadata, one entry per
+# record, and their feature frame, one row per record
+PROCESSED_SCHEMA = Schema('processed', 2, (
+    Field('ids'),
+    Field('locations'),
+    Field('latitudes'),
+    Field('longitudes'),
+    Field('timestamps'),
+    Field('columns'),
+    Field('features'),
+))
+
+# Every known version of each schema, so old binary messages can still be read
+SCHEMA_VERSIONS = {
+    'raw': {
+        RAW_SCHEMA_V1.version: RAW_SCHEMA_V1,
+        RAW_SCHEMA.version: RAW_SCHEMA,
+    },
+    'processed': {
+        PROCESSED_RECORD_SCHEMA.version: PROCESSED_RECORD_SCHEMA,
+        PROCESSED_SCHEMA.version: PROCESSED_SCHEMA,
+    },
+}
+
+
+class MessageCodec:
+    """
+    Encodes and decodes the messages of one topic.
+
+    Messages are written in the configured wire format ('msgpack' or
+    'json') and read in either format. Bytes and CPU time spent on
+    encoding/decoding are tracked and logged with log_stats().
+    """
+
+    FORMATS = ('msgpack', 'json')
+
+    def __init__(self, schema, wire_format=None):
+        self.schema = schema
+        self.wire_format = wire_format or settings.KAFKA_WIRE_FORMAT
+        if self.wire_format not in self.FORMATS:
+            raise ValueError(f"Unknown wire format: {self.wire_format}")
+
+        self.reset_stats()
+        self.last_log = time.monotonic()
+
+    def reset_stats(self):
+        self.stats = {
+            'encoded': 0, 'encoded_bytes': 0, 'encode_seconds': 0.0,
+            'decoded': 0, 'decoded_bytes': 0, 'decode_seconds': 0.0,
+        }
+
+    def encode(self, message):
+        """Encode a message dict into bytes."""
+        start = time.process_time()
+        if self.wire_format == 'msgpack':
+            value = bytes([MAGIC_BYTE, self.schema.version]) + msgpack.packb(
+                self.schema.to_values(message), use_bin_type=True
+            )
+        else:
+            value = json.dumps(
+                self.schema.to_message(self.schema.to_values(message))
+            ).encode()
+
+        self.stats['encoded'] += 1
+        self.stats['encoded_bytes'] += len(value)
+        self.stats['encode_seconds'] += time.process_time() - start
+        return value
+
+    def decode(self, value):
+        """Decode bytes in any supported format into a message dict."""
+        start = time.process_time()
+        if isinstance(value, str):
+            value = value.encode()
+
+        if value[:1] == bytes([MAGIC_BYTE]):
+            version = value[1] if len(value) > 1 else None
+            schema = SCHEMA_VERSIONS[self.schema.name].get(version)
+            if schema is None:
+                raise ValueError(
+                    f"Unknown {self.schema.name} schema version {version}"
+                )
+            values = msgpack.unpackb(value[2:], raw=False)
+            if not isinstance(values, list):
+                raise ValueError(
+                    f"Expected a list of field values, got "
+                    f"{type(values).__name__}"
+                )
+            message = schema.to_message(values)
+            if schema is not self.schema:
+                message = self.upgrade_legacy(message)
+        else:
+            message = json.loads(value)
+            if not isinstance(message, dict):
+                raise ValueError(
+                    f"Expected a JSON object, got {type(message).__name__}"
+                )
+            message = self.upgrade_legacy(message)
+
+        self.stats['decoded'] += 1
+        self.stats['decoded_bytes'] += len(value)
+        self.stats['decode_seconds'] += time.process_time() - start
+        return message
+
+    def upgrade_legacy(self, message):
+        """Convert messages written before the schemas existed to the
+        current layout."""
+        if self.schema.name != 'processed':
+            return message
+
+        # Processed messages used to nest the merged data and repeat it as a
+        # DataFrame
+        if 'data' in message:
+            message = {**message['data'], 'id': message.get('id')}
+
+        # ...then carried one merged record each
+        if 'ids' not in message:
+            message = {
+                'ids': [message.get('id')],
+                'locations': [message.get('location')],
+                'latitudes': [message.get('latitude')],
+                'longitudes': [message.get('longitude')],
+                'timestamps': [message.get('timestamp')],
+                'columns': list(FEATURE_COLUMNS),
+                'features': feature_frame([message]).tolist(),
+            }
+        return message
+
+    def log_stats(self, interval=60):
+        """Log bytes per message and CPU time per message every interval
+        seconds."""
+        if time.monotonic() - self.last_log < interval:
+            return
+
+        stats = self.stats
+        parts = []
+        for action, verb in (('encoded', 'encode'), ('decoded', 'decode')):
+            count = stats[action]
+            if count:
+                size = stats[f'{action}_bytes'] / count
+                seconds = stats[f'{verb}_seconds']
+                parts.append(
+                    f"{action} {count} messages, {size:.0f} bytes/message, "
+                    f"{seconds / count * 1e6:.1f} µs/message"
+                )
+        if parts:
+            logger.info(
+                f"{self.schema.name} codec ({self.wire_format}): "
+                f"{'; '.join(parts)}"
+            )
+
+        self.reset_stats()
+        self.last_log = time.monotonic()
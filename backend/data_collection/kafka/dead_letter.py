@@ -0,0 +1,155 @@
+import time
+
+from confluent_kafka import Consumer, TopicPartition
+from django.conf import settings
+from loguru import logger
+
+from data_collection.kafka.client import build_producer
+
+# Headers added to routed messages
+ORIGINAL_TOPIC = 'retry.topic'
+ATTEMPT = 'retry.attempt'
+DUE = 'retry.due'
+ERROR = 'retry.error'
+
+
+def retry_topic(topic, tier):
+    return f"{topic}-retry-{tier}"
+
+
+def dead_letter_topic(topic):
+    return f"{topic}-dlq"
+
+
+def header(msg, name):
+    """Value of a message header as a string, None if missing."""
+    for key, value in msg.headers() or []:
+        if key == name:
+            return value.decode() if value is not None else None
+    return None
+
+
+class DeadLetterRouter:
+    """
+    Sends messages that failed processing to the retry tiers of their topic
+    (one topic per delay in KAFKA_RETRY_DELAYS), then to its dead-letter
+    topic once every tier has been tried. Malformed messages that cannot
+    succeed on a retry go to the dead-letter topic directly.
+
+    The main loop only produces the message and moves on; the RetryWorker
+    sends it back to its topic once its delay has passed.
+    """
+
+    def __init__(self, producer, delays=None):
+        self.producer = producer
+        self.delays = delays or settings.KAFKA_RETRY_DELAYS
+
+    def route(self, msg, error, retriable=True):
+        topic = header(msg, ORIGINAL_TOPIC) or msg.topic()
+        attempt = int(header(msg, ATTEMPT) or 0)
+        headers = {
+            ORIGINAL_TOPIC: topic,
+            ATTEMPT: str(attempt + 1),
+            ERROR: str(error)[:500],
+        }
+
+        if retriable and attempt < len(self.delays):
+            target = retry_topic(topic, attempt)
+            headers[DUE] = str(time.time() + self.delays[attempt])
+        else:
+            target = dead_letter_topic(topic)
+
+        self.producer.produce(
+            target, key=msg.key(), value=msg.value(),
+            headers=list(headers.items())
+        )
+        logger.warning(
+            f"Routed message {msg.topic()} [{msg.partition()}] "
+            f"@{msg.offset()} to {target}: {error}"
+        )
+
+
+class RetryWorker:
+    """
+    Consumes the retry tiers of the pipeline topics and sends each message
+    back to its original topic once it is due. A tier holds messages of a
+    single delay, so they are due in order: the partition is paused until
+    its first message is due.
+    """
+
+    def __init__(self, topics=None, delays=None):
+        self.topics = topics or [
+            settings.KAFKA_RAW_DATA_TOPIC, settings.KAFKA_PROCESSED_DATA_TOPIC
+        ]
+        self.delays = delays or settings.KAFKA_RETRY_DELAYS
+        self.consumer = Consumer({
+            'bootstrap.servers': settings.KAFKA_BOOTSTRAP_SERVERS,
+            'group.id': 'retry-worker',
+            'auto.offset.reset': 'earliest',
+            'enable.auto.commit': False
+        })
+        self.consumer.subscribe(
+            [
+                retry_topic(topic, tier)
+                for topic in self.topics
+                for tier in range(len(self.delays))
+            ],
+            on_revoke=self.on_revoke
+        )
+        self.producer, self.producer_stats = build_producer('retry-worker')
+        self.paused = {}  # TopicPartition -> due time
+
+    def on_revoke(self, consumer, partitions):
+        for tp in partitions:
+            self.paused.pop(tp, None)
+
+    def resume_due(self):
+        now = time.time()
+        due = [tp for tp, due_at in self.paused.items() if due_at <= now]
+        if due:
+            self.consumer.resume(due)
+            for tp in due:
+                del self.paused[tp]
+
+    def handle(self, msg):
+        """Send a retry message back to its topic, or pause its partition
+        until it is due."""
+        due_at = float(header(msg, DUE) or 0)
+        if due_at > time.time():
+            tp = TopicPartition(msg.topic(), msg.partition(), msg.offset())
+            self.consumer.pause([tp])
+            self.consumer.seek(tp)
+            self.paused[TopicPartition(msg.topic(), msg.partition())] = due_at
+            return
+
+        headers = [
+            (key, value) for key, value in msg.headers() or [] if key != DUE
+        ]
+        self.producer.produce(
+            header(msg, ORIGINAL_TOPIC), key=msg.key(), value=msg.value(),
+            headers=headers
+        )
+        self.producer.flush()
+        self.consumer.commit(message=msg, asynchronous=False)
+
+    def run(self):
+        logger.info(
+            f"Starting retry worker for {', '.join(self.topics)} with delays "
+            f"{self.delays}"
+        )
+
+        while True:
+            try:
+                self.resume_due()
+                msg = self.consumer.poll(1.0)
+                if msg is None:
+                    continue
+
+                if msg.error():
+                    logger.error(f"Consumer error: {msg.error()}")
+                    continue
+
+                self.handle(msg)
+
+            except Exception as e:
+                logger.error(f"Error in retry worker: {e}")
@@ -0,0 +1,129 @@
+import threading
+import time
+from collections import Counter
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket used to stay within a provider's API quota.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = self._check_rate(rate)  # Tokens added per second
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _check_rate(rate):
+        rate = float(rate)
+        if rate <= 0:
+            raise ValueError(f"Rate limit must be positive, got {rate}")
+        return rate
+
+    def _refill(self):
+        now = time.monotonic()
+        refill = (now - self.updated_at) * self.rate
+        self.tokens = min(self.capacity, self.tokens + refill)
+        self.updated_at = now
+
+    def set_rate(self, rate):
+        """Change the refill rate, keeping the tokens accumulated so far."""
+        rate = self._check_rate(rate)
+        with self.lock:
+            self._refill()
+            self.rate = rate
+
+    def acquire(self, tokens=1):
+        """Block until the requested number of tokens is available."""
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+
+            time.sleep(wait)
+
+
+class ProviderClient:
+    """
+    HTTP client for one upstream provider.
+
+    Keeps a pooled keep-alive session for the provider host, applies
+    connect/read deadlines to every call and waits on the provider's
+    token bucket before each request. Calls are counted per endpoint.
+    """
+
+    def __init__(self, name, base_url, rate, burst, pool_size, headers=None):
+        self.name = name
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (
+            settings.HTTP_CONNECT_TIMEOUT, settings.HTTP_READ_TIMEOUT
+        )
+        self.rate = rate  # Configured rate, before any backfill reservation
+        self.rate_limiter = TokenBucket(rate, burst)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        if headers:
+            self.session.headers.update(headers)
+
+        self.call_counts = Counter()
+        self.counts_lock = threading.Lock()
+
+    def get(self, path, params=None, endpoint=None):
+        """Send a rate-limited GET request and return the decoded JSON body."""
+        with self.counts_lock:
+            self.call_counts[endpoint or path] += 1
+
+        self.rate_limiter.acquire()
+        response = self.session.get(
+            f"{self.base_url}{path}", params=params, timeout=self.timeout
+        )
+        response.raise_for_status()
+        return response.json()
+
+    def pop_call_counts(self):
+        """Return the upstream call counts since the last call and reset
+        them."""
+        with self.counts_lock:
+            counts = dict(self.call_counts)
+            self.call_counts.clear()
+        return counts
+
+    def close(self):
+        self.session.close()
+
+
+def build_provider_clients():
+    """Create the clients used by the collector, keyed by provider."""
+    openaq_headers = {}
+    if settings.OPENAQ_API_KEY:
+        openaq_headers['X-API-Key'] = settings.OPENAQ_API_KEY
+
+    return {
+        'openweather': ProviderClient(
+            'openweather',
+            'https://api.openweathermap.org/data/2.5',
+            rate=settings.OPENWEATHER_RATE_LIMIT,
+            burst=settings.OPENWEATHER_RATE_BURST,
+            pool_size=settings.OPENWEATHER_CONCURRENCY,
+        ),
+        'openaq': ProviderClient(
+            'openaq',
+            'https://api.openaq.org/v3',
+            rate=settings.OPENAQ_RATE_LIMIT,
+            burst=settings.OPENAQ_RATE_BURST,
+            pool_size=settings.OPENAQ_CONCURRENCY,
+            headers=openaq_headers,
+        ),
+    }
@@ -0,0 +1,160 @@
+import threading
+import time
+from concurrent.futures import Future
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from loguru import logger
+
+from data_collection.models import OpenAQStationCache
+
+
+class StationCache:
+    """
+    TTL cache of the OpenAQ stations (and their sensors) found around each
+    location.
+
+    Lookups happen from the collector threads and only touch memory. The
+    cache is loaded from and saved to the database by the main thread, so
+    discoveries survive restarts.
+    """
+
+    def __init__(self, ttl=None):
+        self.ttl = timedelta(seconds=ttl or settings.OPENAQ_STATION_CACHE_TTL)
+        self.entries = {}  # location id -> (fetched_at, stations)
+        self.dirty = set()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def load(self):
+        """Evict expired rows and load the remaining ones into memory."""
+        cutoff = timezone.now() - self.ttl
+        evicted = OpenAQStationCache.objects.filter(
+            fetched_at__lt=cutoff
+        ).delete()[0]
+        if evicted:
+            logger.info(
+                f"Evicted {evicted} expired OpenAQ station cache entries"
+            )
+
+        with self.lock:
+            self.entries = {
+                entry.location_id: (entry.fetched_at, entry.stations)
+                for entry in OpenAQStationCache.objects.all()
+            }
+            self.dirty.clear()
+
+    def get(self, location):
+        """Return the cached stations for a location, or None if missing or
+        expired."""
+        with self.lock:
+            entry = self.entries.get(location.id)
+            if entry and timezone.now() - entry[0] < self.ttl:
+                self.hits += 1
+                return entry[1]
+
+            self.misses += 1
+            return None
+
+    def set(self, location, stations):
+        """Cache the stations discovered for a location."""
+        # Only keep what the collector needs from each station
+        stations = [
+            {
+                'id': station.get('id'),
+                'sensors': [
+                    {
+                        'id': sensor['id'],
+                        'parameter': {
+                            'name': sensor.get('parameter', {}).get('name')
+                        }
+                    }
+                    for sensor in station.get('sensors', [])
+                ]
+            }
+            for station in stations
+        ]
+
+        with self.lock:
+            self.entries[location.id] = (timezone.now(), stations)
+            self.dirty.add(location.id)
+
+        return stations
+
+    def save(self):
+        """Persist the entries discovered since the last save."""
+        with self.lock:
+            rows = [
+                OpenAQStationCache(
+                    location_id=location_id,
+                    stations=self.entries[location_id][1],
+                    fetched_at=self.entries[location_id][0]
+                )
+                for location_id in self.dirty
+            ]
+            self.dirty.clear()
+
+        if rows:
+            OpenAQStationCache.objects.bulk_create(
+                rows,
+                update_conflicts=True,
+                unique_fields=['location'],
+                update_fields=['stations', 'fetched_at']
+            )
+
+    def pop_stats(self):
+        """Return hit/miss counters since the last call and reset them."""
+        with self.lock:
+            stats = {'hits': self.hits, 'misses': self.misses}
+            self.hits = 0
+            self.misses = 0
+        return stats
+
+
+class SensorMeasurementCache:
+    """
+    Short-lived cache of sensor measurements.
+
+    A sensor shared by several locations is fetched once per collection
+    window; concurrent requests for the same sensor wait on the first fetch
+    and share its result.
+    """
+
+    def __init__(self):
+        self.futures = {}  # sensor id -> (created_at, future)
+        self.lock = threading.Lock()
+        self.shared = 0
+
+    def reset(self, max_age=0):
+        """Forget the measurements older than max_age seconds."""
+        cutoff = time.monotonic() - max_age
+        with self.lock:
+            self.futures = {
+                sensor_id: entry for sensor_id, entry in self.futures.items()
+                if entry[0] > cutoff and entry[1].done()
+                and entry[1].exception() is None
+            }
+            self.shared = 0
+
+    def get_or_fetch(self, sensor_id, fetch):
+        """Return the measurement for a sensor, calling fetch() only once
+        per window."""
+        with self.lock:
+            entry = self.futures.get(sensor_id)
+            owner = entry is None
+            if owner:
+                future = Future()
+                self.futures[sensor_id] = (time.monotonic(), future)
+            else:
+                future = entry[1]
+                self.shared += 1
+
+        if owner:
+            try:
+                future.set_result(fetch())
+            except Exception as e:
+                future.set_exception(e)
+
+        return future.result()
@@ -0,0 +1,159 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from loguru import logger
+
+from data_collection.kafka.client import build_producer
+from data_collection.kafka.codec import RAW_SCHEMA, MessageCodec
+from data_collection.models import OutboxMessage, RawData
+
+
+def enqueue_raw_data(raw_rows, topic=None, backfill=False):
+    """Insert unsaved RawData rows and their outbox messages in a single
+    transaction.
+
+    In claim-check mode the messages only reference the stored rows: their
+    payload is left out and resolved by the consumer with
+    resolve_raw_payloads().
+    ``backfill`` flags history readings, which the processor stores without
+    joining them with live data.
+    """
+    topic = topic or settings.KAFKA_RAW_DATA_TOPIC
+    claim_check = settings.KAFKA_CLAIM_CHECK
+
+    with transaction.atomic():
+        raw_rows = RawData.objects.bulk_create(raw_rows)
+
+        OutboxMessage.objects.bulk_create([
+            OutboxMessage(
+                topic=topic,
+                # Both sources of a location land on the same partition
+                key=raw_data.location,
+                payload={
+                    'id': raw_data.id,
+                    'source': raw_data.source,
+                    'data': None if claim_check else raw_data.data,
+                    'location': raw_data.location,
+                    'latitude': raw_data.latitude,
+                    'longitude': raw_data.longitude,
+                    'timestamp': raw_data.timestamp.isoformat(),
+                    'backfill': backfill
+                }
+            )
+            for raw_data in raw_rows
+        ])
+
+    return raw_rows
+
+
+def resolve_raw_payloads(messages):
+    """Fill in the payload of claim-check raw messages from RawData, in one
+    query."""
+    ids = [
+        message['id'] for message in messages
+        if message.get('data') is None and message.get('id')
+    ]
+    if not ids:
+        return messages
+
+    payloads = dict(
+        RawData.objects.filter(id__in=ids).values_list('id', 'data')
+    )
+    for message in messages:
+        if message.get('data') is None and message.get('id'):
+            message['data'] = payloads.get(message['id'])
+            if message['data'] is None:
+                logger.warning(f"Raw data with ID {message['id']} not found")
+    return messages
+
+
+class OutboxRelay:
+    """
+    Publishes pending outbox rows to Kafka in batches and marks them as sent.
+    """
+
+    def __init__(self):
+        self.producer, self.producer_stats = build_producer('outbox-relay')
+        self.codec = MessageCodec(RAW_SCHEMA)
+        self.batch_size = settings.OUTBOX_BATCH_SIZE
+        self.retention = timedelta(hours=settings.OUTBOX_RETENTION_HOURS)
+        self.last_purge = None
+
+    def relay_batch(self):
+        """Publish one batch of pending messages. Returns the number of
+        messages sent."""
+        delivered = []
+
+        def delivery_callback(err, msg, outbox_id):
+            if err:
+                logger.error(
+                    f'Outbox message {outbox_id} delivery failed: {err}'
+                )
+            else:
+                delivered.append(outbox_id)
+
+        # Rows stay locked until they are marked as sent, so several relays
+        # can run side by side without publishing the same message twice.
+        with transaction.atomic():
+            pending = list(
+                OutboxMessage.objects.select_for_update(skip_locked=True)
+                .filter(sent_at__isnull=True)
+                .order_by('id')[:self.batch_size]
+            )
+            if not pending:
+                return 0
+
+            for message in pending:
+                self.producer.produce(
+                    message.topic,
+                    key=message.key,
+                    value=self.codec.encode(message.payload),
+                    on_delivery=lambda err, msg, outbox_id=message.id:
+                        delivery_callback(err, msg, outbox_id)
+                )
+
+            remaining = self.producer.flush(settings.OUTBOX_FLUSH_TIMEOUT)
+            if remaining:
+                logger.warning(
+                    f"{remaining} outbox messages still in flight, they will "
+                    "be retried"
+                )
+
+            OutboxMessage.objects.filter(id__in=delivered).update(
+                sent_at=timezone.now()
+            )
+
+        logger.info(f"Relayed {len(delivered)}/{len(pending)} outbox messages")
+        return len(delivered)
+
+    def purge_sent(self):
+        """Delete sent messages older than the retention period."""
+        cutoff = timezone.now() - self.retention
+        deleted = OutboxMessage.objects.filter(sent_at__lt=cutoff).delete()[0]
+        if deleted:
+            logger.info(f"Purged {deleted} sent outbox messages")
+        self.last_purge = timezone.now()
+
+    def run(self):
+        """Main method to run the outbox relay service."""
+        logger.info("Starting outbox relay")
+
+        while True:
+            try:
+                sent = self.relay_batch()
+                self.codec.log_stats()
+
+                if (self.last_purge is None or
+                        timezone.now() - self.last_purge > timedelta(hours=1)):
+                    self.purge_sent()
+
+                # Keep draining while there is a backlog, otherwise wait a bit
+                if sent < self.batch_size:
+                    time.sleep(settings.OUTBOX_POLL_INTERVAL)
+
+            except Exception as e:
+                logger.error(f"Error in outbox relay: {e}")
+                time.sleep(5)
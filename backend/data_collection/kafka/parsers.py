@@ -0,0 +1,117 @@
+import json
+
+from loguru import logger
+
+# Parser instance for each raw data source, filled by register_parser
+PARSERS = {}
+
+
+def register_parser(parser_class):
+    """Class decorator registering a parser for its ``source``."""
+    PARSERS[parser_class.source] = parser_class()
+    return parser_class
+
+
+def get_parser(source):
+    return PARSERS.get(source)
+
+
+def number(value, default=None):
+    """A JSON-safe number: None (or ``default``) stands for missing and NaN."""
+    # NaN is the only value not equal to itself
+    return default if value is None or value != value else value
+
+
+class Parser:
+    """
+    Turns the raw message of one source into the dict stored in the join
+    state. ``side`` is the side of the weather ⨝ pollution join the source
+    feeds.
+    """
+    source = None
+    side = None
+
+    def parse(self, raw_data):
+        """The parsed dict of a raw message, None if its payload is invalid."""
+        raise NotImplementedError
+
+
+@register_parser
+class OpenWeatherParser(Parser):
+    source = 'openweather'
+    side = 'weather'
+
+    def parse(self, raw_data):
+        try:
+            data = raw_data['data']
+            main = data['main']
+            wind = data['wind']
+            weather = data['weather'][0]
+            return {
+                'temperature': number(main['temp']),
+                'feels_like': number(main['feels_like']),
+                'humidity': number(main['humidity']),
+                'pressure': number(main['pressure']),
+                'wind_speed': number(wind['speed']),
+                'wind_direction': number(wind.get('deg'), 0),
+                'clouds': number(data['clouds']['all']),
+                'weather_main': weather['main'],
+                'weather_description': weather['description'],
+                'source': self.source,
+                # Both are left out or null when there is no rain or snow
+                'rain_1h': number((data.get('rain') or {}).get('1h'), 0),
+                'snow_1h': number((data.get('snow') or {}).get('1h'), 0),
+            }
+        except Exception as e:
+            logger.error("Error processing OpenWeather data: {!r}", e)
+            return None
+
+
+@register_parser
+class OpenAQParser(Parser):
+    source = 'openaq'
+    side = 'pollution'
+
+    def parse(self, raw_data):
+        # Serializing the payload is costly: only done for debug logs
+        logger.opt(lazy=True).debug(
+            "Processing OpenAQ data: {}",
+            lambda: json.dumps(raw_data, indent=2)
+        )
+
+        measurements = raw_data.get('data')
+        if not isinstance(measurements, list):
+            logger.error(
+                "Error processing OpenAQ data: expected a list of "
+                "measurements, got {}", type(measurements).__name__
+            )
+            return None
+
+        processed = {
+            'source': self.source,
+            'measurements': {},
+            'metadata': {
+                'location': raw_data.get('location', 'unknown'),
+                'coordinates': {
+                    'latitude': raw_data.get('latitude'),
+                    'longitude': raw_data.get('longitude')
+                }
+            }
+        }
+        for measurement in measurements:
+            try:
+                parameter = measurement.get('parameter') or {}
+                param_name = (parameter.get('name') or '').lower()
+                value = number(measurement.get('value'))
+                if not param_name or value is None:
+                    continue
+
+                units = parameter.get('units', '')
+                processed['measurements'][param_name] = value
+                processed['measurements'][f'{param_name}_units'] = units
+            except Exception as e:
+                logger.warning(
+                    "Error processing measurement {}: {!r}", measurement, e
+                )
+
+        return processed
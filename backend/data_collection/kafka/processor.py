@@ -1,30 +1,94 @@
-import json
+import socket
+import time
+from datetime import datetime
+from datetime import timezone as dt_timezone
 
-import pandas as pd
-from confluent_kafka import Consumer, Producer
+from confluent_kafka import (OFFSET_BEGINNING, Consumer, KafkaException,
+                             TopicPartition)
 from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
 from loguru import logger
 
-from data_collection.models import ProcessedData, RawData
+from data_collection.features import (FEATURE_COLUMNS, feature_frame,
+                                      feature_values)
+from data_collection.kafka.client import ProducerPoller, build_producer
+from data_collection.kafka.codec import (PROCESSED_SCHEMA, RAW_SCHEMA,
+                                         MessageCodec)
+from data_collection.kafka.dead_letter import ATTEMPT, DeadLetterRouter, header
+from data_collection.kafka.outbox import resolve_raw_payloads
+from data_collection.kafka.parsers import get_parser
+from data_collection.kafka.state import JoinStateStore, event_time
+from data_collection.models import LocationFeatures, ProcessedData, RawData
+
+
+def processing_window(timestamp):
+    """Start of the processing window containing a timestamp."""
+    window = settings.PROCESSED_WINDOW_SECONDS
+    return datetime.fromtimestamp(
+        timestamp.timestamp() // window * window, tz=dt_timezone.utc
+    )
+
+
+def batch_offsets(messages):
+    """Offsets to commit after a batch: the next offset of each partition
+    read."""
+    offsets = {}
+    for msg in messages:
+        if not msg.error():
+            offsets[(msg.topic(), msg.partition())] = msg.offset() + 1
+    return [
+        TopicPartition(topic, partition, offset)
+        for (topic, partition), offset in offsets.items()
+    ]
 
 
 class KafkaProcessor:
-    def __init__(self):
+    def __init__(self, worker_index=0):
         # Setup consumer
         self.consumer = Consumer({
             'bootstrap.servers': settings.KAFKA_BOOTSTRAP_SERVERS,
             'group.id': 'data-processor',
-            'auto.offset.reset': 'latest'
+            'auto.offset.reset': 'earliest',
+            'enable.auto.commit': False,
+            'isolation.level': 'read_committed'
         })
-        self.consumer.subscribe([settings.KAFKA_RAW_DATA_TOPIC])
+        self.consumer.subscribe(
+            [settings.KAFKA_RAW_DATA_TOPIC],
+            on_assign=self.on_assign,
+            on_revoke=self.on_revoke,
+            on_lost=self.on_lost
+        )
+        self.batch_size = settings.PROCESSOR_BATCH_SIZE
+        self.batch_timeout = settings.PROCESSOR_BATCH_TIMEOUT
+
+        # Weather ⨝ pollution join state, restored from the database as
+        # partitions are assigned
+        self.state = JoinStateStore()
         
-        # Setup producer
-        self.producer = Producer({
-            'bootstrap.servers': settings.KAFKA_BOOTSTRAP_SERVERS,
-            'client.id': 'data-processor'
-        })
+        # Setup producer; delivery callbacks are served by a background poll
+        # thread.
+        # In exactly-once mode the output messages and the input offsets are
+        # committed in one Kafka transaction. The transactional id is stable
+        # per worker so a restarted worker fences its previous incarnation.
+        self.exactly_once = settings.PROCESSOR_EXACTLY_ONCE
+        overrides = {}
+        if self.exactly_once:
+            overrides = {
+                'transactional.id':
+                    f"data-processor-{socket.gethostname()}-{worker_index}",
+                'enable.idempotence': True,
+            }
+        self.producer, self.producer_stats = build_producer(
+            'data-processor', **overrides
+        )
+        self.poller = ProducerPoller(self.producer)
+        self.router = DeadLetterRouter(self.producer)
         self.output_topic = settings.KAFKA_PROCESSED_DATA_TOPIC
+
+        # Wire formats of the input and output topics
+        self.input_codec = MessageCodec(RAW_SCHEMA)
+        self.output_codec = MessageCodec(PROCESSED_SCHEMA)
         
         # Delivery callback
         def delivery_callback(err, msg):
@@ -35,86 +99,37 @@ class KafkaProcessor:
         
         self.delivery_callback = delivery_callback
     
-    def process_openweather_data(self, raw_data):
-        """Process OpenWeather data into a structured format."""
-        try:
-            data = raw_data['data']
-            
-            # Extract relevant weather information
-            processed = {
-                'temperature': data['main']['temp'],
-                'feels_like': data['main']['feels_like'],
-                'humidity': data['main']['humidity'],
-                'pressure': data['main']['pressure'],
-                'wind_speed': data['wind']['speed'],
-                'wind_direction': data['wind'].get('deg', 0),
-                'clouds': data['clouds']['all'],
-                'weather_main': data['weather'][0]['main'],
-                'weather_description': data['weather'][0]['description'],
-                'source': 'openweather'
-            }
-            
-            # Add rain and snow if available
-            if 'rain' in data:
-                processed['rain_1h'] = data['rain'].get('1h', 0)
-            else:
-                processed['rain_1h'] = 0
-                
-            if 'snow' in data:
-                processed['snow_1h'] = data['snow'].get('1h', 0)
-            else:
-                processed['snow_1h'] = 0
-            
-            return processed
-            
-        except KeyError as e:
-            logger.error(f"Error processing OpenWeather data: {e}")
-            return None
+    def on_assign(self, consumer, partitions):
+        """Pick up the join state of the newly assigned partitions."""
+        logger.info(f"Assigned partitions {[p.partition for p in partitions]}")
+        self.state.restore(p.partition for p in partitions)
 
-    def process_openaq_data(self, raw_data):
-        """Process OpenAQ data into a structured format."""
-        try:
-            # Debug log to inspect raw data structure
-            logger.debug(f"Processing OpenAQ data: {json.dumps(raw_data, indent=2)}")
-
-            # Initialize processed data structure
-            processed = {
-                'source': 'openaq',
-                'measurements': {},
-                'metadata': {
-                    'location': raw_data.get('location', 'unknown'),
-                    'coordinates': {
-                        'latitude': raw_data.get('latitude'),
-                        'longitude': raw_data.get('longitude')
-                    }
-                }
-            }
-
-            # Process each measurement in the list
-            for measurement in raw_data['data']:
-                try:
-                    param_name = measurement.get('parameter', {}).get('name', '').lower()
-                    value = measurement.get('value')
+    def on_revoke(self, consumer, partitions):
+        """Hand off the join state of the partitions taken away from this
+        worker."""
+        logger.info(f"Revoked partitions {[p.partition for p in partitions]}")
+        self.state.release(p.partition for p in partitions)
 
-                    if param_name and value is not None:
-                        # Store the measurement value
-                        processed['measurements'][param_name] = value
+    def on_lost(self, consumer, partitions):
+        """Forget the join state of partitions lost without a handover.
 
-                        # Optionally store additional metadata for each parameter
-                        processed['measurements'][f'{param_name}_units'] = measurement.get('parameter', {}).get('units',
-                                                                                                                '')
+        Another worker may already own them, so nothing is written back.
+        """
+        logger.warning(f"Lost partitions {[p.partition for p in partitions]}")
+        self.state.drop(p.partition for p in partitions)
 
-                except Exception as e:
-                    logger.warning(f"Error processing measurement {measurement}: {str(e)}")
-                    continue
-
-            return processed
+    @staticmethod
+    def process_openweather_data(raw_data):
+        """Process OpenWeather data into a structured format."""
+        return get_parser('openweather').parse(raw_data)
 
-        except Exception as e:
-            logger.error(f"Error processing OpenAQ data: {str(e)}")
-            return None
+    @staticmethod
+    def process_openaq_data(raw_data):
+        """Process OpenAQ data into a structured format."""
+        return get_parser('openaq').parse(raw_data)
     
-    def merge_data(self, weather_data, pollution_data, location_name):
+    @staticmethod
+    def merge_data(weather_data, pollution_data, location_name):
         """Merge weather and pollution data for the same location."""
         if not weather_data or not pollution_data:
             return None
@@ -128,164 +143,438 @@ class KafkaProcessor:
 
         return merged
     
-    def store_processed_data(self, processed_data, raw_data_ids):
-        """Store processed data in the database."""
-        try:
-            # Create ProcessedData object
-            processed_obj = ProcessedData.objects.create(
+    @staticmethod
+    def store_processed_batch(records):
+        """Upsert merged records in the database with bulk queries.
+
+        ``records`` is a list of (processed_data, raw_data_ids) tuples. Rows
+        are keyed by (location, processing window), so storing the same
+        records again (e.g. after a replay) updates them in place; within a
+        batch the last record of a window wins. Returns the stored objects.
+        """
+        rows = {}
+        for processed_data, raw_ids in records:
+            timestamp = datetime.fromisoformat(processed_data['timestamp'])
+            window_start = processing_window(timestamp)
+            rows[(processed_data['location'], window_start)] = (ProcessedData(
                 data=processed_data,
                 location=processed_data['location'],
                 latitude=float(processed_data.get('latitude', 0)),
                 longitude=float(processed_data.get('longitude', 0)),
-                timestamp=timezone.now()
+                timestamp=timestamp,
+                window_start=window_start
+            ), raw_ids)
+
+        processed_objs = [processed_obj for processed_obj, _ in rows.values()]
+        records = [
+            (processed_obj.data, raw_ids)
+            for processed_obj, raw_ids in rows.values()
+        ]
+
+        with transaction.atomic():
+            ProcessedData.objects.bulk_create(
+                processed_objs,
+                update_conflicts=True,
+                unique_fields=['location', 'window_start'],
+                update_fields=['data', 'latitude', 'longitude', 'timestamp']
             )
-            
-            # Link to raw data
-            for raw_id in raw_data_ids:
-                try:
-                    raw_data = RawData.objects.get(id=raw_id)
-                    processed_obj.raw_data.add(raw_data)
-                except RawData.DoesNotExist:
-                    logger.warning(f"Raw data with ID {raw_id} not found")
-            
-            processed_obj.save()
-            return processed_obj
-            
-        except Exception as e:
-            logger.error(f"Error storing processed data: {e}")
-            return None
-    
-    def convert_to_dataframe(self, processed_data):
-        """Convert processed data to a pandas DataFrame."""
-        try:
-            # Flatten the nested structure
-            flat_data = {
-                'location': processed_data['location'],
-                'timestamp': processed_data['timestamp'],
-                'latitude': processed_data.get('latitude', 0),
-                'longitude': processed_data.get('longitude', 0),
+
+            # Upserted rows don't get their primary key back
+            ids = {
+                (location, window_start): pk
+                for location, window_start, pk in ProcessedData.objects.filter(
+                    location__in={location for location, _ in rows},
+                    window_start__in={window_start for _, window_start in rows}
+                ).values_list('location', 'window_start', 'id')
             }
-            
-            # Add weather data
-            for key, value in processed_data.get('weather', {}).items():
-                flat_data[f'weather_{key}'] = value
-            
-            # Add pollution data
-            for key, value in processed_data.get('pollution', {}).items():
-                flat_data[f'pollution_{key}'] = value
-            
-            # Create DataFrame with a single row
-            df = pd.DataFrame([flat_data])
-            return df
-            
-        except Exception as e:
-            logger.error(f"Error converting to DataFrame: {e}")
+            for key, (processed_obj, _) in rows.items():
+                processed_obj.id = ids[key]
+
+            # Link to raw data, skipping ids that no longer exist
+            requested_ids = {
+                raw_id for _, raw_ids in records for raw_id in raw_ids
+            }
+            existing_ids = set(
+                RawData.objects.filter(id__in=requested_ids)
+                .values_list('id', flat=True)
+            )
+            for raw_id in requested_ids - existing_ids:
+                logger.warning(f"Raw data with ID {raw_id} not found")
+
+            # Replace the links of rows updated in place
+            Through = ProcessedData.raw_data.through
+            Through.objects.filter(processeddata_id__in=[
+                processed_obj.id for processed_obj in processed_objs
+            ]).delete()
+            Through.objects.bulk_create([
+                Through(processeddata_id=processed_obj.id, rawdata_id=raw_id)
+                for processed_obj, (_, raw_ids) in zip(processed_objs, records)
+                for raw_id in set(raw_ids) & existing_ids
+            ])
+
+            KafkaProcessor.store_features(processed_objs)
+
+        return processed_objs
+
+    @staticmethod
+    def store_features(processed_objs):
+        """Upsert the feature store rows of stored ProcessedData objects."""
+        LocationFeatures.objects.bulk_create(
+            [
+                LocationFeatures(
+                    processed_id=processed_obj.id,
+                    location=processed_obj.location,
+                    latitude=processed_obj.latitude,
+                    longitude=processed_obj.longitude,
+                    timestamp=processed_obj.timestamp,
+                    **dict(zip(
+                        FEATURE_COLUMNS, feature_values(processed_obj.data)
+                    ))
+                )
+                for processed_obj in processed_objs
+            ],
+            update_conflicts=True,
+            unique_fields=['processed'],
+            update_fields=[
+                'location', 'latitude', 'longitude', 'timestamp',
+                *FEATURE_COLUMNS
+            ]
+        )
+
+    def join_message(self, raw_data, partition=-1, processed=None,
+                     retried=False):
+        """Add a raw message to the join state.
+
+        ``processed`` is the message already parsed by its source parser, if
+        any, and ``retried`` tells whether it was re-delivered by the retry
+        worker. Returns (merged_data, raw_ids) when the message joins a recent
+        enough reading of the other source for its location, None otherwise.
+        """
+        location = raw_data.get('location')
+        source = raw_data.get('source')
+
+        # Skip if missing critical data
+        if not location or not source:
+            logger.warning("Skipping message with missing location or source")
             return None
-    
+
+        parser = get_parser(source)
+        if parser is None:
+            logger.warning(f"Skipping message from unknown source {source}")
+            return None
+
+        if processed is None:
+            processed = parser.parse(raw_data)
+        if not processed:
+            return None
+
+        entry = self.state.add(
+            location,
+            parser.side,
+            processed,
+            raw_data.get('id'),
+            event_time(raw_data),
+            raw_data.get('latitude'),
+            raw_data.get('longitude'),
+            partition,
+            retried
+        )
+        if not entry:
+            return None
+
+        merged_data = self.merge_data(
+            entry['weather']['value'], entry['pollution']['value'], location
+        )
+        if not merged_data:
+            return None
+
+        # The record is as recent as its latest reading, so a replay gives
+        # the same record
+        joined_at = max(
+            entry['weather']['event_time'], entry['pollution']['event_time']
+        )
+        merged_data['timestamp'] = datetime.fromtimestamp(
+            joined_at, tz=dt_timezone.utc
+        ).isoformat()
+
+        # Add coordinates
+        merged_data['latitude'] = entry['latitude']
+        merged_data['longitude'] = entry['longitude']
+        return merged_data, [
+            entry['weather']['raw_id'], entry['pollution']['raw_id']
+        ]
+
+    def process_batch(self, messages):
+        """Join, store and forward a batch of raw messages."""
+        decoded = []
+        for msg in messages:
+            if msg.error():
+                logger.error(f"Consumer error: {msg.error()}")
+                continue
+
+            try:
+                decoded.append((self.input_codec.decode(msg.value()), msg))
+            except ValueError as e:
+                logger.error(f"Error decoding message: {e}")
+                self.router.route(msg, e, retriable=False)
+
+        # Claim-check messages only carry the id of their RawData row
+        resolve_raw_payloads([raw_data for raw_data, _ in decoded])
+
+        # History readings are stored on their own, away from the live join
+        backfill = [
+            raw_data for raw_data, _ in decoded if raw_data.get('backfill')
+        ]
+        decoded = [
+            (raw_data, msg) for raw_data, msg in decoded
+            if not raw_data.get('backfill')
+        ]
+        if backfill:
+            self.process_backfill(backfill)
+
+        # Join in arrival order
+        records = []
+        for raw_data, msg in decoded:
+            parser = get_parser(raw_data.get('source'))
+            processed = parser.parse(raw_data) if parser else None
+            if parser and processed is None:
+                self.router.route(
+                    msg, f"Invalid {raw_data.get('source')} payload",
+                    retriable=False
+                )
+                continue
+            record = self.join_message(
+                raw_data, msg.partition(), processed,
+                retried=header(msg, ATTEMPT) is not None
+            )
+            if record:
+                records.append(record)
+
+        if not records:
+            return 0
+
+        # Store every merged record of the batch at once
+        processed_objs = self.store_processed_batch(records)
+
+        # Send the batch's feature frame to the output topic for the ML
+        # model, in one message
+        frame = feature_frame([obj.data for obj in processed_objs])
+        self.producer.produce(
+            self.output_topic,
+            value=self.output_codec.encode({
+                'ids': [obj.id for obj in processed_objs],
+                'locations': [obj.location for obj in processed_objs],
+                'latitudes': [obj.latitude for obj in processed_objs],
+                'longitudes': [obj.longitude for obj in processed_objs],
+                'timestamps': [
+                    obj.timestamp.isoformat() for obj in processed_objs
+                ],
+                'columns': list(FEATURE_COLUMNS),
+                'features': frame.tolist(),
+            }),
+            callback=self.delivery_callback
+        )
+
+        logger.debug(
+            f"Processed batch of {len(messages)} messages into "
+            f"{len(processed_objs)} records"
+        )
+        return len(processed_objs)
+
+    @staticmethod
+    def process_backfill(messages):
+        """Merge and store backfilled readings, without forwarding them.
+
+        The backfill stores both RawData rows of a day before publishing
+        them, so a reading whose partner is not in the batch is paired with
+        the row in the database. The readings never enter the join state,
+        and no prediction (nor alert) is made for them.
+        """
+        days = {}
+        for raw_data in messages:
+            key = (raw_data.get('location'), raw_data.get('timestamp'))
+            days.setdefault(key, {})[raw_data.get('source')] = raw_data
+
+        incomplete = [key for key, sources in days.items() if len(sources) < 2]
+        if incomplete:
+            partners = RawData.objects.filter(
+                location__in={location for location, _ in incomplete},
+                timestamp__in={
+                    datetime.fromisoformat(timestamp)
+                    for _, timestamp in incomplete
+                }
+            )
+            for row in partners:
+                key = (row.location, row.timestamp.isoformat())
+                if key in days:
+                    days[key].setdefault(
+                        row.source, {'id': row.id, 'data': row.data}
+                    )
+
+        records = []
+        for (location, timestamp), sources in days.items():
+            weather = sources.get('openweather')
+            pollution = sources.get('openaq')
+            if not weather or not pollution:
+                logger.warning(
+                    f"Backfilled reading of {location} at {timestamp} "
+                    f"has no partner"
+                )
+                continue
+
+            merged = KafkaProcessor.merge_data(
+                get_parser('openweather').parse(weather),
+                get_parser('openaq').parse(pollution),
+                location
+            )
+            if not merged:
+                continue
+
+            reading = weather if 'location' in weather else pollution
+            merged['timestamp'] = timestamp
+            merged['latitude'] = reading.get('latitude')
+            merged['longitude'] = reading.get('longitude')
+            records.append((merged, [weather['id'], pollution['id']]))
+
+        if records:
+            KafkaProcessor.store_processed_batch(records)
+        return len(records)
+
+    def process_singly(self, messages, error):
+        """Process the messages of a failed batch one at a time.
+
+        Only the messages that fail on their own are sent to the retry
+        topic, so one bad record no longer parks its whole batch.
+        """
+        logger.error(
+            f"Error processing batch of {len(messages)} messages, "
+            f"processing them one at a time: {error}"
+        )
+        failed = 0
+        for msg in messages:
+            if msg.error():
+                continue
+            try:
+                self.process_batch([msg])
+            except KafkaException:
+                raise
+            except Exception as e:
+                logger.error(f"Error processing message, retrying later: {e}")
+                self.router.route(msg, e)
+                failed += 1
+
+        logger.info(f"{failed} of {len(messages)} messages sent to retry")
+
+    def process_transaction(self, messages):
+        """Process a batch and commit its output messages and input offsets
+        atomically."""
+        self.producer.begin_transaction()
+        try:
+            try:
+                self.process_batch(messages)
+            except KafkaException:
+                raise
+            except Exception as e:
+                # Drop the batch's output and process its messages singly
+                self.producer.abort_transaction()
+                self.reload_state()
+                self.producer.begin_transaction()
+                self.process_singly(messages, e)
+
+            self.producer.send_offsets_to_transaction(
+                batch_offsets(messages),
+                self.consumer.consumer_group_metadata()
+            )
+            self.producer.commit_transaction()
+        except Exception:
+            # Nothing of the batch is visible downstream; read it again
+            self.producer.abort_transaction()
+            self.reload_state()
+            self.rewind()
+            raise
+
+        # The snapshot only ever holds the state of committed batches
+        self.state.flush()
+
+    def reload_state(self):
+        """Drop the join state changes of a failed batch.
+
+        The assigned partitions are reloaded from the snapshot, which is
+        only written once a batch is committed.
+        """
+        self.state.clear()
+        self.state.restore(tp.partition for tp in self.consumer.assignment())
+
+    def rewind(self):
+        """Seek the assigned partitions back to their committed offsets."""
+        assignment = self.consumer.assignment()
+        for tp in self.consumer.committed(assignment, timeout=10):
+            if tp.offset < 0:
+                tp = TopicPartition(tp.topic, tp.partition, OFFSET_BEGINNING)
+            self.consumer.seek(tp)
+
     def run(self):
         """Main method to run the processor service."""
         logger.info("Starting Kafka Processor for data transformation")
-        
-        # Storage for latest data by location
-        latest_data = {}
-        
+        if self.exactly_once:
+            self.producer.init_transactions()
+        self.poller.start()
+
+        try:
+            self._run_loop()
+        finally:
+            # Leaving the group revokes the partitions and snapshots their
+            # state
+            self.consumer.close()
+            self.poller.stop()
+            self.state.close()
+
+    def _run_loop(self):
+        last_eviction = time.monotonic()
+
         while True:
             try:
-                # Poll for messages
-                msg = self.consumer.poll(1.0)
-                
-                if msg is None:
-                    continue
-                
-                if msg.error():
-                    logger.error(f"Consumer error: {msg.error()}")
-                    continue
-                
-                # Process the message
-                try:
-                    raw_data = json.loads(msg.value())
-                    location = raw_data.get('location')
-                    source = raw_data.get('source')
-                    
-                    # Skip if missing critical data
-                    if not location or not source:
-                        logger.warning("Skipping message with missing location or source")
-                        continue
-                    
-                    # Process based on source
-                    if source == 'openweather':
-                        logger.debug(' source openweather')
-                        processed = self.process_openweather_data(raw_data)
-                        if processed:
-                            if location not in latest_data:
-                                latest_data[location] = {'raw_ids': []}
-                            latest_data[location]['weather'] = processed
-                            latest_data[location]['raw_ids'].append(raw_data.get('id'))
-                            latest_data[location]['latitude'] = raw_data.get('latitude')
-                            latest_data[location]['longitude'] = raw_data.get('longitude')
-                    
-                    elif source == 'openaq':
-                        logger.debug('source openaq')
-                        processed = self.process_openaq_data(raw_data)
-                        if processed:
-                            if location not in latest_data:
-                                latest_data[location] = {'raw_ids': []}
-                            latest_data[location]['pollution'] = processed
-                            latest_data[location]['raw_ids'].append(raw_data.get('id'))
-                            latest_data[location]['latitude'] = raw_data.get('latitude')
-                            latest_data[location]['longitude'] = raw_data.get('longitude')
-                    
-                    # Check if we have both weather and pollution data for this location
-                    if location in latest_data and 'weather' in latest_data[location] and 'pollution' in latest_data[location]:
-                        # We have both data types, merge and send to output topic
-                        merged_data = self.merge_data(
-                            latest_data[location]['weather'],
-                            latest_data[location]['pollution'],
-                            location
+                # Consume a micro-batch of messages
+                messages = self.consumer.consume(
+                    self.batch_size, self.batch_timeout
+                )
+
+                if time.monotonic() - last_eviction >= 60:
+                    dropped = self.state.evict_expired()
+                    if dropped:
+                        logger.info(
+                            f"Evicted {dropped} expired readings from the "
+                            "join state"
                         )
-                        
-                        if merged_data:
-                            logger.debug('merged_data')
-                            # Add coordinates
-                            merged_data['latitude'] = latest_data[location]['latitude']
-                            merged_data['longitude'] = latest_data[location]['longitude']
-                            
-                            # Store in database
-                            processed_obj = self.store_processed_data(
-                                merged_data,
-                                latest_data[location]['raw_ids']
-                            )
-                            
-                            if processed_obj:
-                                # Convert to DataFrame for ML model
-                                logger.debug('Start converting dataFrame for ML model')
-                                df = self.convert_to_dataframe(merged_data)
-                                
-                                if df is not None:
-                                    # Send to output topic for ML model
-                                    output_message = {
-                                        'id': processed_obj.id,
-                                        'data': merged_data,
-                                        'dataframe': df.to_json(orient='records')
-                                    }
-                                    logger.debug(self.output_topic)
-                                    logger.debug(output_message)
-
-                                    self.producer.produce(
-                                        self.output_topic,
-                                        key=location,
-                                        value=json.dumps(output_message),
-                                        callback=self.delivery_callback
-                                    )
-                            
-                            # Clear the data for this location
-                            latest_data[location] = {'raw_ids': []}
-                
-                except json.JSONDecodeError as e:
-                    logger.error(f"Error decoding message: {e}")
-                
-                # Flush producer
-                self.producer.flush()
-                
+                    last_eviction = time.monotonic()
+
+                if not messages:
+                    self.state.flush()
+                    continue
+
+                if self.exactly_once:
+                    self.process_transaction(messages)
+                else:
+                    try:
+                        self.process_batch(messages)
+                    except Exception as e:
+                        self.reload_state()
+                        self.process_singly(messages, e)
+
+                    # Snapshot the join state, then commit offsets once per
+                    # batch, so a restart resumes from a state matching the
+                    # committed offsets
+                    self.state.flush()
+                    self.consumer.commit(asynchronous=False)
+
+                self.input_codec.log_stats()
+                self.output_codec.log_stats()
+
+            except KafkaException as e:
+                # A fenced or otherwise broken transactional producer cannot
+                # recover
+                if e.args[0].fatal():
+                    raise
+                logger.error(f"Error in processor service: {e}")
             except Exception as e:
-                logger.error(f"Error in processor service: {e}")
\ No newline at end of file
+                logger.error(f"Error in processor service: {e}")
@@ -1,214 +1,329 @@
-import json
+import threading
 import time
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-import requests
-from confluent_kafka import Producer
 from django.conf import settings
 from django.utils import timezone
 from loguru import logger
 
+from data_collection.kafka.http_client import build_provider_clients
+from data_collection.kafka.openaq_cache import (SensorMeasurementCache,
+                                                StationCache)
+from data_collection.kafka.outbox import enqueue_raw_data
+from data_collection.kafka.scheduler import CollectionScheduler
+from data_collection.kafka.sharding import LocationSharder
 from data_collection.models import Location, RawData
 
+# Requests per second; lowest rate left to a replica whatever is reserved
+MIN_PROVIDER_RATE = 0.001
+
 
 class KafkaProducer:
     def __init__(self):
-        self.producer = Producer({
-            'bootstrap.servers': settings.KAFKA_BOOTSTRAP_SERVERS,
-            'client.id': 'data-collector'
-        })
         self.topic = settings.KAFKA_RAW_DATA_TOPIC
         self.openweather_api_key = settings.OPENWEATHER_API_KEY
         self.openaq_api_key = settings.OPENAQ_API_KEY
-        
-        # Delivery callback
-        def delivery_callback(err, msg):
-            if err:
-                logger.error(f'Message delivery failed: {err}')
-            else:
-                logger.debug(f'Message delivered to {msg.topic()} [{msg.partition()}]')
-        
-        self.delivery_callback = delivery_callback
-    
-    def fetch_openweather_data(self, location):
-        """Fetch weather data from OpenWeather API for a location."""
-        url = "https://api.openweathermap.org/data/2.5/weather"
+
+        # Pooled, rate-limited HTTP clients keyed by provider
+        self.clients = build_provider_clients()
+
+        # OpenAQ stations rarely change: cache them across cycles and restarts,
+        # and fetch each sensor only once per collection window.
+        self.station_cache = StationCache()
+        self.station_cache.load()
+        self.sensor_cache = SensorMeasurementCache()
+
+        # Concurrency limits: the pool bounds the total number of in-flight
+        # requests, the semaphores bound each provider individually.
+        self.max_workers = settings.COLLECTOR_MAX_WORKERS
+        self.provider_limits = {
+            'openweather': threading.BoundedSemaphore(
+                settings.OPENWEATHER_CONCURRENCY
+            ),
+            'openaq': threading.BoundedSemaphore(
+                settings.OPENAQ_CONCURRENCY
+            ),
+        }
+
+        # Duration and upstream call counts of the last collection cycle
+        self.last_cycle_duration = None
+        self.upstream_calls = {}
+
+        # Completed fetches are written in batches of this size
+        self.write_batch_size = settings.COLLECTOR_WRITE_BATCH_SIZE
+
+        # Decides when each (location, source) pair is polled next
+        self.scheduler = CollectionScheduler()
+        self.sharder = LocationSharder()
+        self.locations = {}
+        self.locations_refreshed_at = float('-inf')
+
+    def request_openweather_data(self, location):
+        """Call the OpenWeather API for a location and return the payload."""
         params = {
             'lat': location.latitude,
             'lon': location.longitude,
             'appid': self.openweather_api_key,
             'units': 'metric'
         }
-        
-        try:
-            response = requests.get(url, params=params)
-            response.raise_for_status()
-            data = response.json()
-            
-            # Save to database
-            timestamp = timezone.now()
-            raw_data = RawData.objects.create(
-                source='openweather',
-                data=data,
-                location=location.name,
-                latitude=location.latitude,
-                longitude=location.longitude,
-                timestamp=timestamp
-            )
-            
-            # Prepare message for Kafka
-            message = {
-                'id': raw_data.id,
-                'source': 'openweather',
-                'data': data,
-                'location': location.name,
-                'latitude': location.latitude,
-                'longitude': location.longitude,
-                'timestamp': timestamp.isoformat()
-            }
-            
-            # Send to Kafka
-            self.producer.produce(
-                self.topic,
-                key=f"openweather-{location.name}",
-                value=json.dumps(message),
-                callback=self.delivery_callback
-            )
-            
-            logger.info(f"Fetched OpenWeather data for {location.name}")
-            return data
-            
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Error fetching OpenWeather data for {location.name}: {e}")
-            return None
 
-    def fetch_openaq_data(self, location):
-        """Fetch daily pollution measurements from multiple OpenAQ sensors around a location."""
-        base_url = "https://api.openaq.org/v3"
+        return self.clients['openweather'].get(
+            '/weather', params=params, endpoint='weather'
+        )
 
-        headers = {}
-        if self.openaq_api_key:
-            headers['X-API-Key'] = self.openaq_api_key
+    def request_openaq_data(self, location):
+        """Call the OpenAQ API for the sensors around a location and return
+        the measurements."""
+        openaq = self.clients['openaq']
 
-        try:
-            # Étape 1 : Chercher plusieurs stations proches
-            stations_response = requests.get(
-                f"{base_url}/locations",
+        # Étape 1 : Chercher plusieurs stations proches (mises en cache)
+        stations = self.station_cache.get(location)
+        if stations is None:
+            stations_data = openaq.get(
+                '/locations',
                 params={
                     'coordinates': f"{location.latitude},{location.longitude}",
                     'radius': 10000,
                     'limit': 5,
                     'sort': 'asc'
                 },
-                headers=headers
+                endpoint='locations'
             )
-            stations_response.raise_for_status()
-            stations_data = stations_response.json()
-
-            if not stations_data.get('results'):
-                logger.warning(f"Aucune station OpenAQ trouvée près de {location.name}")
-                return None
-
-            all_measurements = []
-            seen_params = set()
-
-            # Étape 2 : Parcourir les stations et capteurs
-            for station in stations_data['results']:
-                sensors = station.get('sensors', [])
-                for sensor in sensors:
-                    param_name = sensor.get("parameter", {}).get("name")
-                    if param_name in seen_params:
-                        continue  # on a déjà un capteur pour ce paramètre
-
-                    sensor_id = sensor['id']
-                    sensor_response = requests.get(
-                        f"{base_url}/sensors/{sensor_id}/measurements/daily",
+            stations = self.station_cache.set(
+                location, stations_data.get('results') or []
+            )
+
+        if not stations:
+            logger.warning(
+                f"Aucune station OpenAQ trouvée près de {location.name}"
+            )
+            return None
+
+        all_measurements = []
+        seen_params = set()
+
+        # Étape 2 : Parcourir les stations et capteurs
+        for station in stations:
+            sensors = station.get('sensors', [])
+            for sensor in sensors:
+                param_name = sensor.get("parameter", {}).get("name")
+                if param_name in seen_params:
+                    continue  # on a déjà un capteur pour ce paramètre
+
+                sensor_id = sensor['id']
+                sensor_data = self.sensor_cache.get_or_fetch(
+                    sensor_id,
+                    lambda: openaq.get(
+                        f"/sensors/{sensor_id}/measurements/daily",
                         params={
                             "limit": 1,
                             "sort": "desc"
                         },
-                        headers=headers
+                        endpoint='measurements'
                     )
-                    sensor_response.raise_for_status()
-                    sensor_data = sensor_response.json()
-
-                    if sensor_data.get("results"):
-                        measurement = sensor_data["results"][0]
-                        all_measurements.append(measurement)
-                        seen_params.add(param_name)
-
-                if len(seen_params) >= 5:  # tu peux ajuster ce seuil selon tes besoins
-                    break
-
-            if not all_measurements:
-                logger.warning(f"Aucune mesure trouvée pour les capteurs autour de {location.name}")
-                return None
-
-            # Étape 3 : Sauvegarde en base
-            timestamp = timezone.now()
-            raw_data = RawData.objects.create(
-                source='openaq',
-                data=all_measurements,
+                )
+
+                if sensor_data.get("results"):
+                    measurement = sensor_data["results"][0]
+                    all_measurements.append(measurement)
+                    seen_params.add(param_name)
+
+            # tu peux ajuster ce seuil selon tes besoins
+            if len(seen_params) >= 5:
+                break
+
+        if not all_measurements:
+            logger.warning(
+                "Aucune mesure trouvée pour les capteurs autour de "
+                f"{location.name}"
+            )
+            return None
+
+        return all_measurements
+
+    def publish_raw_batch(self, results):
+        """Store raw payloads and their outbox messages in a single
+        transaction.
+
+        ``results`` is a list of (source, location, data) tuples. The outbox
+        relay publishes the messages to Kafka once the transaction commits.
+        """
+        timestamp = timezone.now()
+
+        return enqueue_raw_data([
+            RawData(
+                source=source,
+                data=data,
                 location=location.name,
                 latitude=location.latitude,
                 longitude=location.longitude,
                 timestamp=timestamp
             )
+            for source, location, data in results
+        ], self.topic)
+
+    def _request(self, source, location):
+        """Run the upstream request for one (source, location) pair within
+        the provider limit."""
+        request_functions = {
+            'openweather': self.request_openweather_data,
+            'openaq': self.request_openaq_data,
+        }
+        with self.provider_limits[source]:
+            return request_functions[source](location)
+
+    def collect(self, tasks):
+        """Fetch the given (source, location) pairs concurrently.
 
-            # Étape 4 : Envoi à Kafka
-            message = {
-                'id': raw_data.id,
-                'source': 'openaq',
-                'data': all_measurements,
-                'location': location.name,
-                'latitude': location.latitude,
-                'longitude': location.longitude,
-                'timestamp': timestamp.isoformat()
+        HTTP calls run in a bounded thread pool; results are written in
+        batches from the calling thread as they complete, so database
+        access stays on a single connection. Payloads identical to the
+        previous poll of the same pair are not stored again.
+        """
+        start = time.monotonic()
+        published = 0
+        unchanged = 0
+        failed = 0
+        pending = []
+        self.sensor_cache.reset(max_age=settings.OPENAQ_MIN_INTERVAL / 2)
+
+        with ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix='collector'
+        ) as executor:
+            futures = {
+                executor.submit(self._request, *task): task for task in tasks
             }
 
-            self.producer.produce(
-                self.topic,
-                key=f"openaq-{location.name}",
-                value=json.dumps(message),
-                callback=self.delivery_callback
-            )
+            for future in as_completed(futures):
+                source, location = futures[future]
+                try:
+                    data = future.result()
+                except Exception as e:
+                    logger.error(
+                        f"Error fetching {source} data for {location.name}: "
+                        f"{e}"
+                    )
+                    self.scheduler.record_failure(location.id, source)
+                    failed += 1
+                    continue
 
-            logger.info(f"Mesures journalières complètes OpenAQ récupérées pour {location.name}")
-            return all_measurements
+                if not self.scheduler.record(location.id, source, data):
+                    unchanged += 1
+                    continue
 
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Erreur lors de la récupération des mesures journalières OpenAQ pour {location.name} : {e}")
-            return None
+                pending.append((source, location, data))
+                logger.info(f"Fetched {source} data for {location.name}")
+
+                if len(pending) >= self.write_batch_size:
+                    published += len(self.publish_raw_batch(pending))
+                    pending = []
+
+        if pending:
+            published += len(self.publish_raw_batch(pending))
+
+        self.station_cache.save()
+
+        self.last_cycle_duration = time.monotonic() - start
+        logger.info(
+            f"Collection of {len(tasks)} sources took "
+            f"{self.last_cycle_duration:.2f}s "
+            f"({published} published, {unchanged} unchanged, {failed} failed)"
+        )
+        self.log_upstream_calls()
+        return published
+
+    def log_upstream_calls(self):
+        """Log the upstream calls of the last cycle and what the OpenAQ
+        caches saved."""
+        self.upstream_calls = {
+            name: client.pop_call_counts()
+            for name, client in self.clients.items()
+        }
+        station_stats = self.station_cache.pop_stats()
+
+        logger.info(
+            f"Upstream calls: {self.upstream_calls} | "
+            f"OpenAQ station cache: {station_stats['hits']} hits, "
+            f"{station_stats['misses']} misses | "
+            f"shared sensor fetches: {self.sensor_cache.shared}"
+        )
+
+    def refresh_locations(self):
+        """Reload the active locations owned by this instance and sync them
+        with the scheduler."""
+        owned = self.sharder.assign(Location.objects.filter(is_active=True))
+        self.locations = {location.id: location for location in owned}
+        self.scheduler.sync(self.locations)
+        self.apply_rates()
+        self.locations_refreshed_at = time.monotonic()
+
+    def apply_rates(self):
+        """Set this instance's share of the provider rate limits.
+
+        The configured rates are the quota of the whole collector group: what
+        is left once the backfills took their reserved rates is split evenly
+        between the live replicas, and recomputed when the group changes.
+        """
+        reserved = self.sharder.reserved_rates_total()
+        members = len(self.sharder.members) or 1
+        for name, client in self.clients.items():
+            available = client.rate - reserved.get(name, 0.0)
+            rate = max(available / members, MIN_PROVIDER_RATE)
+            if rate != client.rate_limiter.rate:
+                logger.info(
+                    f"{name} rate limit set to {rate:.3f} requests/s "
+                    f"({members} collectors, "
+                    f"{reserved.get(name, 0.0):.3f} reserved by backfills)"
+                )
+                client.rate_limiter.set_rate(rate)
 
     def run(self):
         """Main method to run the producer service."""
         logger.info("Starting Kafka Producer for data collection")
-        
+        self.sharder.start()
+
+        try:
+            self._run_loop()
+        finally:
+            self.sharder.stop()
+
+    def _run_loop(self):
+        refresh_interval = settings.COLLECTOR_LOCATION_REFRESH_INTERVAL
         while True:
             try:
-                # Get all active locations
-                locations = Location.objects.filter(is_active=True)
-                
-                if not locations:
-                    logger.warning("No active locations found, waiting 60 seconds")
-                    time.sleep(60)
+                # Pick up added or deactivated locations and instances
+                since_refresh = time.monotonic() - self.locations_refreshed_at
+                if since_refresh >= refresh_interval:
+                    self.refresh_locations()
+
+                if not self.locations:
+                    logger.warning(
+                        "No active locations assigned to this instance, "
+                        f"waiting {refresh_interval} seconds"
+                    )
+                    time.sleep(refresh_interval)
+                    self.locations_refreshed_at = float('-inf')
                     continue
-                
-                for location in locations:
-                    # Fetch data from both APIs
-                    self.fetch_openweather_data(location)
-                    self.fetch_openaq_data(location)
-                    
-                    # Small delay between locations to avoid rate limits
-                    time.sleep(1)
-                
-                # Flush to ensure all messages are sent
-                self.producer.flush()
-                
-                # Wait before next collection cycle (5 minutes)
-                logger.info("Data collection cycle complete, waiting 30 secondes")
-                time.sleep(30)
-                
+
+                # Fetch every (location, source) pair that is due
+                due = self.scheduler.pop_due()
+                tasks = [
+                    (source, self.locations[location_id])
+                    for location_id, source in due
+                    if location_id in self.locations
+                ]
+                if tasks:
+                    self.collect(tasks)
+
+                # Sleep until the next pair is due or locations need a refresh
+                wait = self.scheduler.seconds_until_next()
+                refresh_in = refresh_interval - (
+                    time.monotonic() - self.locations_refreshed_at
+                )
+                wait = refresh_in if wait is None else min(wait, refresh_in)
+                if wait > 0:
+                    time.sleep(wait)
+
             except Exception as e:
                 logger.error(f"Error in producer service: {e}")
                 time.sleep(60)  # Wait a bit before retrying
\ No newline at end of file
@@ -0,0 +1,132 @@
+import hashlib
+import heapq
+import itertools
+import json
+import time
+
+from django.conf import settings
+
+
+def content_hash(payload):
+    """Stable hash of an upstream payload, used to detect unchanged data."""
+    encoded = json.dumps(payload, sort_keys=True, default=str).encode()
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class CollectionScheduler:
+    """
+    Priority scheduler deciding when each (location, source) pair is polled
+    next.
+
+    Every pair has its own polling interval bounded by the source's
+    [min, max] range: it shrinks when the upstream payload changed since the
+    last poll and grows when it did not, so each source ends up being polled
+    at roughly the rate its data actually changes.
+    """
+
+    BACKOFF = 1.5  # Interval multiplier when the payload did not change
+    SPEEDUP = 0.5  # Interval multiplier when the payload changed
+
+    def __init__(self, intervals=None):
+        # source -> (min interval, max interval) in seconds
+        self.intervals = intervals or {
+            'openweather': (
+                settings.OPENWEATHER_MIN_INTERVAL,
+                settings.OPENWEATHER_MAX_INTERVAL,
+            ),
+            'openaq': (
+                settings.OPENAQ_MIN_INTERVAL,
+                settings.OPENAQ_MAX_INTERVAL,
+            ),
+        }
+        self.heap = []  # (due_at, sequence, location_id, source)
+        self.counter = itertools.count()
+        # (location_id, source) -> {'interval', 'hash', 'sequence'}, where
+        # sequence identifies the only heap entry of the pair still valid
+        self.state = {}
+        self.active = set()
+
+    @property
+    def sources(self):
+        return list(self.intervals)
+
+    def _push(self, due_at, location_id, source):
+        sequence = next(self.counter)
+        self.state[(location_id, source)]['sequence'] = sequence
+        heapq.heappush(self.heap, (due_at, sequence, location_id, source))
+
+    def _is_current(self, entry):
+        _, sequence, location_id, source = entry
+        state = self.state.get((location_id, source))
+        return state is not None and state['sequence'] == sequence
+
+    def sync(self, location_ids):
+        """Schedule new locations immediately and forget inactive ones."""
+        location_ids = set(location_ids)
+        now = time.monotonic()
+
+        for location_id in location_ids - self.active:
+            for source, (min_interval, _) in self.intervals.items():
+                self.state[(location_id, source)] = {
+                    'interval': min_interval, 'hash': None, 'sequence': None,
+                }
+                self._push(now, location_id, source)
+
+        for location_id in self.active - location_ids:
+            for source in self.intervals:
+                self.state.pop((location_id, source), None)
+
+        self.active = location_ids
+
+    def pop_due(self):
+        """Return every (location_id, source) pair that is due now."""
+        now = time.monotonic()
+        due = []
+        while self.heap and self.heap[0][0] <= now:
+            entry = heapq.heappop(self.heap)
+            # Entries of removed (or removed then re-added) locations are
+            # dropped lazily
+            if self._is_current(entry):
+                _, _, location_id, source = entry
+                self.state[(location_id, source)]['sequence'] = None
+                due.append((location_id, source))
+        return due
+
+    def seconds_until_next(self):
+        """Seconds before the next pair is due, None if none is scheduled."""
+        while self.heap and not self._is_current(self.heap[0]):
+            heapq.heappop(self.heap)
+        if not self.heap:
+            return None
+        return max(0.0, self.heap[0][0] - time.monotonic())
+
+    def record(self, location_id, source, payload):
+        """Reschedule a pair after a successful poll.
+
+        Returns True if the payload changed.
+        """
+        state = self.state.get((location_id, source))
+        if state is None:
+            return True
+
+        min_interval, max_interval = self.intervals[source]
+        digest = content_hash(payload)
+        changed = payload is not None and digest != state['hash']
+
+        if changed:
+            interval = max(min_interval, state['interval'] * self.SPEEDUP)
+        else:
+            interval = min(max_interval, state['interval'] * self.BACKOFF)
+        state['interval'] = interval
+        state['hash'] = digest
+
+        self._push(time.monotonic() + state['interval'], location_id, source)
+        return changed
+
+    def record_failure(self, location_id, source):
+        """Reschedule a failed pair for a retry at its minimum interval."""
+        if (location_id, source) not in self.state:
+            return
+
+        min_interval, _ = self.intervals[source]
+        self._push(time.monotonic() + min_interval, location_id, source)
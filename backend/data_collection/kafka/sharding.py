@@ -0,0 +1,131 @@
+import hashlib
+import os
+import socket
+import threading
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+from loguru import logger
+
+from data_collection.models import CollectorInstance
+
+
+class LocationSharder:
+    """
+    Splits the active locations between the running producer instances.
+
+    Every instance heartbeats into the CollectorInstance table. Instances
+    with a recent heartbeat are the live members, and each location is
+    owned by one member chosen by rendezvous hashing. When an instance joins
+    or stops heartbeating only the locations it owned (or takes over) move.
+
+    History backfills join with the 'backfill' role: they own no location,
+    but the request rates they reserve are taken from the collectors' rate
+    limits (see reserved_rates_total()).
+    """
+
+    def __init__(self, instance_id=None, role='collector',
+                 reserved_rates=None):
+        self.instance_id = instance_id or (
+            f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        )
+        self.role = role
+        self.reserved_rates = reserved_rates or {}
+        self.ttl = timedelta(seconds=settings.COLLECTOR_INSTANCE_TTL)
+        self.members = []
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def heartbeat(self):
+        """Record that this instance is alive and drop long-dead instances."""
+        now = timezone.now()
+        CollectorInstance.objects.update_or_create(
+            instance_id=self.instance_id,
+            defaults={
+                'heartbeat_at': now,
+                'role': self.role,
+                'reserved_rates': self.reserved_rates,
+            }
+        )
+        CollectorInstance.objects.filter(
+            heartbeat_at__lt=now - self.ttl * 10
+        ).delete()
+
+    def _heartbeat_loop(self):
+        while not self.stop_event.wait(settings.COLLECTOR_HEARTBEAT_INTERVAL):
+            try:
+                self.heartbeat()
+            except Exception as e:
+                logger.error(f"Error sending collector heartbeat: {e}")
+            finally:
+                connection.close()
+
+    def start(self):
+        """Register this instance and keep heartbeating from a background
+        thread."""
+        self.heartbeat()
+        self.thread = threading.Thread(
+            target=self._heartbeat_loop,
+            name=f'{self.role}-heartbeat',
+            daemon=True
+        )
+        self.thread.start()
+        logger.info(
+            f"{self.role.capitalize()} instance {self.instance_id} registered"
+        )
+
+    def stop(self):
+        """Stop heartbeating and leave the group so others take over right
+        away."""
+        self.stop_event.set()
+        CollectorInstance.objects.filter(instance_id=self.instance_id).delete()
+
+    def live_instances(self):
+        cutoff = timezone.now() - self.ttl
+        return CollectorInstance.objects.filter(heartbeat_at__gte=cutoff)
+
+    def live_members(self):
+        members = set(
+            self.live_instances().filter(role='collector')
+            .values_list('instance_id', flat=True)
+        )
+        # This instance always takes part, even if its heartbeat is late
+        members.add(self.instance_id)
+        return sorted(members)
+
+    def reserved_rates_total(self):
+        """Request rates reserved by live backfills, summed per provider."""
+        totals = {}
+        backfills = self.live_instances().filter(role='backfill')
+        for rates in backfills.values_list('reserved_rates', flat=True):
+            for provider, rate in rates.items():
+                totals[provider] = totals.get(provider, 0.0) + rate
+        return totals
+
+    @staticmethod
+    def owner(location_id, members):
+        """Pick the member owning a location (highest random weight)."""
+        return max(
+            members,
+            key=lambda member: hashlib.sha1(
+                f"{member}:{location_id}".encode()
+            ).digest()
+        )
+
+    def assign(self, locations):
+        """Return the locations owned by this instance."""
+        members = self.live_members()
+        if members != self.members:
+            logger.info(
+                f"Collector group changed: {len(members)} live instances, "
+                "rebalancing locations"
+            )
+            self.members = members
+
+        return [
+            location for location in locations
+            if self.owner(location.id, members) == self.instance_id
+        ]
@@ -0,0 +1,209 @@
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from django.conf import settings
+from django.db import transaction
+from loguru import logger
+
+from data_collection.models import JoinStateEntry
+
+
+def event_time(raw_data):
+    """Event time of a raw message in epoch seconds, falling back to now."""
+    try:
+        return datetime.fromisoformat(raw_data['timestamp']).timestamp()
+    except (KeyError, TypeError, ValueError):
+        return time.time()
+
+
+class JoinStateStore:
+    """
+    State of the weather ⨝ pollution join, keyed by location.
+
+    Each location keeps the latest reading of each side with its event time;
+    a reading older than the one kept for its side (late or replayed) is
+    dropped.
+    A new reading joins the other side only if that side is recent enough
+    (weather and pollution have their own maximum age), so stale data is
+    never merged. Sides older than their maximum age relative to the
+    highest event time seen are evicted, and the number of locations kept in
+    memory is capped (least recently updated first).
+
+    Changes are written to the JoinStateEntry table with flush(), so a
+    restart recovers the half-joined readings without replaying the topic.
+    Entries are tagged with the Kafka partition their location maps to:
+    when partitions move to another worker, on this host or another one,
+    release() hands their entries over through the table and restore()
+    picks them up on the other side. Partitions lost without a clean
+    handover are dropped from memory without touching the table.
+    """
+
+    SIDES = ('weather', 'pollution')
+
+    def __init__(self, max_age=None, max_entries=None):
+        self.max_age = max_age or {
+            'weather': settings.JOIN_WEATHER_MAX_AGE,
+            'pollution': settings.JOIN_POLLUTION_MAX_AGE,
+        }
+        self.max_entries = max_entries or settings.JOIN_STATE_MAX_LOCATIONS
+        # location -> entry, least recently updated first
+        self.entries = OrderedDict()
+        self.dirty = set()
+        self.watermark = 0.0  # Highest event time seen
+
+    def __len__(self):
+        return len(self.entries)
+
+    def restore(self, partitions=None):
+        """Load the snapshot of the given partitions (all if None)."""
+        rows = JoinStateEntry.objects.all()
+        if partitions is not None:
+            rows = rows.filter(kafka_partition__in=list(partitions))
+
+        restored = 0
+        rows = rows.values_list('location', 'entry')
+        for location, entry in rows.iterator():
+            self.entries[location] = entry
+            restored += 1
+            self.watermark = max(self.watermark, self._latest(entry))
+
+        # Restore the recency order
+        self.entries = OrderedDict(sorted(
+            self.entries.items(), key=lambda item: self._latest(item[1])
+        ))
+        logger.info(f"Restored join state for {restored} locations")
+
+    def _forget(self, partitions):
+        partitions = set(partitions)
+        forgotten = [
+            location for location, entry in self.entries.items()
+            if entry.get('partition') in partitions
+        ]
+        for location in forgotten:
+            del self.entries[location]
+            self.dirty.discard(location)
+        return len(forgotten)
+
+    def release(self, partitions):
+        """Snapshot and forget the entries of partitions no longer owned."""
+        self.flush()
+        released = self._forget(partitions)
+        logger.info(f"Handed off join state for {released} locations")
+
+    def drop(self, partitions):
+        """Forget the entries of lost partitions without writing them.
+
+        The partitions may already belong to another worker, whose snapshot
+        must not be overwritten with this worker's stale entries.
+        """
+        dropped = self._forget(partitions)
+        logger.warning(f"Dropped join state for {dropped} locations")
+
+    def clear(self):
+        """Forget the entries in memory, including unflushed changes."""
+        self.entries.clear()
+        self.dirty.clear()
+
+    def _latest(self, entry):
+        times = [
+            entry[side]['event_time'] for side in self.SIDES if side in entry
+        ]
+        return max(times, default=0.0)
+
+    def _joinable(self, side, side_time, other, other_time):
+        if side_time >= other_time:
+            return side_time - other_time <= self.max_age[other]
+        return other_time - side_time <= self.max_age[side]
+
+    def add(self, location, side, value, raw_id, event_time,
+            latitude=None, longitude=None, partition=-1, retried=False):
+        """Store a reading for one side of the join.
+
+        Returns the location's entry if the reading joins the other side,
+        None otherwise (including when the reading is older than the one
+        already kept for its side). Retried readings are late by their retry
+        delay and skip that check.
+        """
+        other = 'pollution' if side == 'weather' else 'weather'
+
+        current = self.entries.get(location, {}).get(side)
+        if current and not retried and event_time < current['event_time']:
+            logger.debug(f"Dropped late {side} reading for {location}")
+            return None
+
+        entry = self.entries.pop(location, None) or {}
+        entry[side] = {
+            'value': value, 'raw_id': raw_id, 'event_time': event_time
+        }
+        entry['latitude'] = latitude
+        entry['longitude'] = longitude
+        entry['partition'] = partition
+        self.entries[location] = entry
+        self.dirty.add(location)
+        self.watermark = max(self.watermark, event_time)
+
+        while len(self.entries) > self.max_entries:
+            evicted, _ = self.entries.popitem(last=False)
+            self.dirty.add(evicted)
+            logger.warning(f"Join state full, evicted {evicted}")
+
+        partner = entry.get(other)
+        if partner and self._joinable(
+            side, event_time, other, partner['event_time']
+        ):
+            return entry
+        return None
+
+    def evict_expired(self):
+        """Drop the sides too old to join anything anymore.
+
+        Returns the number dropped.
+        """
+        dropped = 0
+        for location in list(self.entries):
+            entry = self.entries[location]
+            for side in self.SIDES:
+                if side not in entry:
+                    continue
+                age = self.watermark - entry[side]['event_time']
+                if age > self.max_age[side]:
+                    del entry[side]
+                    dropped += 1
+                    self.dirty.add(location)
+
+            if not any(side in entry for side in self.SIDES):
+                del self.entries[location]
+
+        return dropped
+
+    def flush(self):
+        """Write the locations changed since the last flush to the snapshot."""
+        if not self.dirty:
+            return
+
+        upserts = [
+            JoinStateEntry(
+                location=location,
+                entry=self.entries[location],
+                kafka_partition=self.entries[location].get('partition', -1)
+            )
+            for location in self.dirty if location in self.entries
+        ]
+        deletes = [
+            location for location in self.dirty if location not in self.entries
+        ]
+
+        with transaction.atomic():
+            JoinStateEntry.objects.bulk_create(
+                upserts,
+                update_conflicts=True,
+                unique_fields=['location'],
+                update_fields=['entry', 'kafka_partition']
+            )
+            if deletes:
+                JoinStateEntry.objects.filter(location__in=deletes).delete()
+        self.dirty.clear()
+
+    def close(self):
+        self.flush()
@@ -0,0 +1,81 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from loguru import logger
+
+from data_collection.backfill import HistoryBackfiller
+from data_collection.models import Location
+
+
+class Command(BaseCommand):
+    help = (
+        'Backfill daily OpenWeather and OpenAQ history for locations '
+        '(resumable)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--location', action='append', dest='locations',
+            help='Location id or name (repeatable, defaults to all active '
+                 'locations)'
+        )
+        parser.add_argument(
+            '--start', type=date.fromisoformat,
+            help='First day to backfill (YYYY-MM-DD)'
+        )
+        parser.add_argument(
+            '--end', type=date.fromisoformat,
+            help='Last day to backfill (YYYY-MM-DD, defaults to yesterday)'
+        )
+        parser.add_argument(
+            '--days', type=int, default=30,
+            help='Number of days to backfill when --start is not given'
+        )
+        parser.add_argument(
+            '--sink', choices=HistoryBackfiller.SINKS, default='db',
+            help='db: bulk insert processed rows, topic: send raw data '
+                 'through the pipeline'
+        )
+        parser.add_argument(
+            '--chunk-days', type=int, help='Days fetched per chunk'
+        )
+        parser.add_argument(
+            '--workers', type=int, help='Chunks fetched in parallel'
+        )
+
+    def handle(self, *args, **options):
+        end = options['end'] or date.today() - timedelta(days=1)
+        start = options['start'] or end - timedelta(days=options['days'] - 1)
+        if start > end:
+            raise CommandError('--start must be before --end')
+
+        locations = Location.objects.filter(is_active=True)
+        if options['locations']:
+            values = options['locations']
+            ids = [value for value in values if value.isdigit()]
+            names = [value for value in values if not value.isdigit()]
+            locations = (
+                Location.objects.filter(id__in=ids)
+                | Location.objects.filter(name__in=names)
+            )
+        locations = list(locations)
+
+        if not locations:
+            raise CommandError('No location to backfill')
+
+        logger.info(
+            f'Starting history backfill for {len(locations)} locations'
+        )
+        try:
+            backfiller = HistoryBackfiller(
+                sink=options['sink'],
+                chunk_days=options['chunk_days'],
+                workers=options['workers']
+            )
+            stored = backfiller.backfill(locations, start, end)
+        except (ValueError, RuntimeError) as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Backfilled {stored} days of history')
+        )
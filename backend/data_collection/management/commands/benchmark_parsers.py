@@ -0,0 +1,153 @@
+import json
+import random
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from loguru import logger
+
+from data_collection.kafka.parsers import PARSERS
+from data_collection.models import RawData
+
+
+def sample_message(source, i):
+    """A synthetic raw message shaped like the collector's output."""
+    message = {
+        'id': i,
+        'source': source,
+        'location': f'Location {i % 50}',
+        'latitude': 48.85,
+        'longitude': 2.35,
+        'timestamp': '2025-01-01T12:00:00+00:00',
+    }
+    if source == 'openweather':
+        message['data'] = {
+            'main': {
+                'temp': random.uniform(-5, 35),
+                'feels_like': 20.1,
+                'humidity': 60,
+                'pressure': 1013,
+            },
+            'wind': {'speed': 3.6, 'deg': 220},
+            'clouds': {'all': 40},
+            'weather': [{'main': 'Clouds', 'description': 'scattered clouds'}],
+            'rain': {'1h': 0.2},
+        }
+    else:
+        message['data'] = [
+            {
+                'value': random.uniform(0, 80),
+                'parameter': {'name': name, 'units': 'µg/m³'},
+                'period': {'datetimeFrom': {'utc': '2025-01-01T00:00:00Z'}},
+            }
+            for name in ('pm25', 'pm10', 'no2', 'o3', 'so2')
+        ]
+    return message
+
+
+def legacy_openweather(raw_data):
+    """Per-message parser as it was before the registry, kept as the
+    baseline."""
+    data = raw_data['data']
+    return {
+        'temperature': data['main']['temp'],
+        'feels_like': data['main']['feels_like'],
+        'humidity': data['main']['humidity'],
+        'pressure': data['main']['pressure'],
+        'wind_speed': data['wind']['speed'],
+        'wind_direction': data['wind'].get('deg', 0),
+        'clouds': data['clouds']['all'],
+        'weather_main': data['weather'][0]['main'],
+        'weather_description': data['weather'][0]['description'],
+        'source': 'openweather',
+        'rain_1h': data['rain'].get('1h', 0) if 'rain' in data else 0,
+        'snow_1h': data['snow'].get('1h', 0) if 'snow' in data else 0,
+    }
+
+
+def legacy_openaq(raw_data):
+    """Per-message parser as it was before the registry, kept as the
+    baseline."""
+    logger.debug(f"Processing OpenAQ data: {json.dumps(raw_data, indent=2)}")
+    measurements = {}
+    for measurement in raw_data['data']:
+        param_name = measurement.get('parameter', {}).get('name', '').lower()
+        value = measurement.get('value')
+        if param_name and value is not None:
+            units = measurement.get('parameter', {}).get('units', '')
+            measurements[param_name] = value
+            measurements[f'{param_name}_units'] = units
+    return {'source': 'openaq', 'measurements': measurements}
+
+
+LEGACY = {'openweather': legacy_openweather, 'openaq': legacy_openaq}
+
+
+class Command(BaseCommand):
+    help = 'Compare the per-message cost of the raw data parsers'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--messages', type=int, default=20000,
+            help='Messages parsed per source'
+        )
+        parser.add_argument(
+            '--from-db', action='store_true',
+            help='Use the latest RawData rows instead of synthetic messages'
+        )
+        parser.add_argument(
+            '--log-level', default='INFO', help='Log level while parsing'
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=3,
+            help='Runs of each benchmark, the best one is kept'
+        )
+
+    @staticmethod
+    def time(run):
+        start = time.perf_counter()
+        run()
+        return time.perf_counter() - start
+
+    def messages(self, source, count, from_db):
+        if not from_db:
+            return [sample_message(source, i) for i in range(count)]
+
+        rows = list(
+            RawData.objects.filter(source=source).order_by('-timestamp')
+            .values(
+                'id', 'source', 'location', 'latitude', 'longitude', 'data'
+            )[:count]
+        )
+        if not rows:
+            raise CommandError(f'No {source} raw data in the database')
+        # Repeat the rows up to the requested count
+        return [rows[i % len(rows)] for i in range(count)]
+
+    def handle(self, *args, **options):
+        count = options['messages']
+
+        # Parsing logs go through the level under test, results are printed
+        logger.remove()
+        logger.add(sys.stderr, level=options['log_level'])
+
+        for source, parser in PARSERS.items():
+            messages = self.messages(source, count, options['from_db'])
+            runs = {}
+            if source in LEGACY:
+                legacy = LEGACY[source]
+                runs['legacy'] = lambda: [legacy(m) for m in messages]
+            runs['registry'] = lambda: [parser.parse(m) for m in messages]
+
+            # Best of several runs, to leave out warm-up and GC pauses
+            timings = {}
+            for name, run in runs.items():
+                timings[name] = min(
+                    self.time(run) for _ in range(options['repeat'])
+                )
+
+            level = options['log_level']
+            self.stdout.write(f'{source} ({count} messages, {level} logs):')
+            for name, seconds in timings.items():
+                cost = seconds / count * 1e6
+                self.stdout.write(f'  {name:<10} {cost:8.2f} µs/message')
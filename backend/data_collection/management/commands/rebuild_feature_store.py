@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from data_collection.kafka.processor import KafkaProcessor
+from data_collection.models import ProcessedData
+
+
+class Command(BaseCommand):
+    help = (
+        'Fill the feature store from the processed data stored before it '
+        'existed'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=5000,
+            help='Processed rows per query'
+        )
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Rewrite every row instead of the ones missing from the '
+                 'feature store'
+        )
+
+    def handle(self, *args, **options):
+        queryset = ProcessedData.objects.only(
+            'id', 'data', 'location', 'latitude', 'longitude', 'timestamp'
+        )
+        if not options['all']:
+            queryset = queryset.filter(features__isnull=True)
+
+        # Walk the primary key so every batch is a fresh, indexed query
+        last_id = 0
+        total = 0
+        while True:
+            batch = list(
+                queryset.filter(id__gt=last_id)
+                .order_by('id')[:options['batch_size']]
+            )
+            if not batch:
+                break
+
+            with transaction.atomic():
+                KafkaProcessor.store_features(batch)
+            last_id = batch[-1].id
+            total += len(batch)
+            self.stdout.write(f'{total} rows written')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Feature store rebuilt from {total} processed rows'
+        ))
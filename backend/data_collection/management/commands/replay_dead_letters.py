@@ -0,0 +1,84 @@
+import time
+
+from confluent_kafka import Consumer
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from loguru import logger
+
+from data_collection.kafka.client import build_producer
+from data_collection.kafka.dead_letter import (ATTEMPT, DUE, ERROR,
+                                               dead_letter_topic)
+
+
+class Command(BaseCommand):
+    help = (
+        'Send the messages of a dead-letter topic back to their original '
+        'topic'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--topic', default=settings.KAFKA_RAW_DATA_TOPIC,
+            help='Original topic whose dead letters are replayed'
+        )
+        parser.add_argument(
+            '--limit', type=int, help='Maximum number of messages to replay'
+        )
+        parser.add_argument(
+            '--timeout', type=float, default=10,
+            help='Stop after this many seconds without a new message'
+        )
+
+    def handle(self, *args, **options):
+        topic = options['topic']
+        limit = options['limit']
+
+        consumer = Consumer({
+            'bootstrap.servers': settings.KAFKA_BOOTSTRAP_SERVERS,
+            'group.id': 'dead-letter-replay',
+            'auto.offset.reset': 'earliest',
+            'enable.auto.commit': False
+        })
+        consumer.subscribe([dead_letter_topic(topic)])
+        producer, _ = build_producer('dead-letter-replay')
+
+        replayed = 0
+        last_message = time.monotonic()
+        try:
+            while limit is None or replayed < limit:
+                msg = consumer.poll(1.0)
+                if msg is None:
+                    if time.monotonic() - last_message >= options['timeout']:
+                        break
+                    continue
+
+                last_message = time.monotonic()
+                if msg.error():
+                    logger.error(f"Consumer error: {msg.error()}")
+                    continue
+
+                # Replayed messages get a fresh set of retries
+                headers = [
+                    (key, value) for key, value in msg.headers() or []
+                    if key not in (ATTEMPT, DUE, ERROR)
+                ]
+                producer.produce(
+                    topic, key=msg.key(), value=msg.value(), headers=headers
+                )
+                replayed += 1
+
+                if replayed % 1000 == 0:
+                    producer.flush()
+                    consumer.commit(asynchronous=False)
+                    logger.info(f'Replayed {replayed} messages')
+
+            producer.flush()
+            if replayed:
+                consumer.commit(asynchronous=False)
+        finally:
+            consumer.close()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Replayed {replayed} messages from {dead_letter_topic(topic)} '
+            f'to {topic}'
+        ))
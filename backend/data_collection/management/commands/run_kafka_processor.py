@@ -1,13 +1,75 @@
+import multiprocessing
+import signal
+import sys
+import time
+
+from django.conf import settings
 from django.core.management.base import BaseCommand
+from django.db import connections
 from loguru import logger
 
 from data_collection.kafka.processor import KafkaProcessor
 
 
+def run_worker(index):
+    """Entry point of a forked processor worker."""
+    # Exit through sys.exit so the consumer leaves the group and hands off
+    # its state
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    logger.info(f'Starting Kafka Processor worker {index}')
+    KafkaProcessor(index).run()
+
+
 class Command(BaseCommand):
     help = 'Run the Kafka Processor to transform raw data'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int,
+            help='Processes consuming the raw topic partitions in parallel'
+        )
+
     def handle(self, *args, **options):
-        logger.info('Starting Kafka Processor')
-        processor = KafkaProcessor()
-        processor.run()
\ No newline at end of file
+        workers = options['workers'] or settings.PROCESSOR_WORKERS
+        if workers <= 1:
+            logger.info('Starting Kafka Processor')
+            processor = KafkaProcessor()
+            processor.run()
+            return
+
+        logger.info(f'Starting Kafka Processor with {workers} workers')
+
+        # Children must not inherit the parent's database connections
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        processes = {}
+
+        def start(index):
+            process = context.Process(
+                target=run_worker, args=(index,),
+                name=f'kafka-processor-{index}'
+            )
+            process.start()
+            processes[index] = process
+
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        try:
+            for index in range(workers):
+                start(index)
+
+            # Restart the workers that died; the group rebalances their
+            # partitions meanwhile
+            while True:
+                time.sleep(5)
+                for index, process in list(processes.items()):
+                    if not process.is_alive():
+                        logger.warning(
+                            f'Processor worker {index} exited with code '
+                            f'{process.exitcode}, restarting'
+                        )
+                        start(index)
+        finally:
+            for process in processes.values():
+                process.terminate()
+            for process in processes.values():
+                process.join()
@@ -1,3 +1,6 @@
+import signal
+import sys
+
 from django.core.management.base import BaseCommand
 from loguru import logger
 
@@ -9,5 +12,10 @@ class Command(BaseCommand):
 
     def handle(self, *args, **options):
         logger.info('Starting Kafka Producer')
+
+        # Exit cleanly on docker stop so the instance leaves the collector
+        # group
+        signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+
         producer = KafkaProducer()
         producer.run()
\ No newline at end of file
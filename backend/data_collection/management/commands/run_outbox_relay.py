@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from loguru import logger
+
+from data_collection.kafka.outbox import OutboxRelay
+
+
+class Command(BaseCommand):
+    help = 'Run the outbox relay to publish stored raw data to Kafka'
+
+    def handle(self, *args, **options):
+        logger.info('Starting outbox relay')
+        relay = OutboxRelay()
+        relay.run()
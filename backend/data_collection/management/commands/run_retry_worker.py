@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from loguru import logger
+
+from data_collection.kafka.dead_letter import RetryWorker
+
+
+class Command(BaseCommand):
+    help = (
+        'Send messages parked on the retry topics back to their topic once '
+        'their delay has passed'
+    )
+
+    def handle(self, *args, **options):
+        logger.info('Starting retry worker')
+        worker = RetryWorker()
+        worker.run()
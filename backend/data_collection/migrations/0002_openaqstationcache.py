@@ -0,0 +1,45 @@
+# Generated by Django 4.2.12 on 2026-10-18 12:58
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("data_collection", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OpenAQStationCache",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("stations", models.JSONField(default=list)),
+                ("fetched_at", models.DateTimeField()),
+                (
+                    "location",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="openaq_stations",
+                        to="data_collection.location",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["fetched_at"],
+                        name="data_collec_fetched_9e8698_idx",
+                    )
+                ],
+            },
+        ),
+    ]
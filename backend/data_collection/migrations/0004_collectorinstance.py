@@ -0,0 +1,37 @@
+# Generated by Django 4.2.12 on 2026-10-18 13:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("data_collection", "0003_outboxmessage"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CollectorInstance",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("instance_id", models.CharField(max_length=255, unique=True)),
+                ("heartbeat_at", models.DateTimeField()),
+                ("started_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["heartbeat_at"],
+                        name="data_collec_heartbe_f18380_idx",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 4.2.12 on 2026-10-18 13:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("data_collection", "0004_collectorinstance"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BackfillCheckpoint",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("start_date", models.DateField()),
+                ("end_date", models.DateField()),
+                ("sink", models.CharField(max_length=20)),
+                ("records", models.IntegerField(default=0)),
+                ("completed_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "location",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="backfill_checkpoints",
+                        to="data_collection.location",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["location", "start_date"],
+                        name="data_collec_locatio_d6e6aa_idx",
+                    )
+                ],
+            },
+        ),
+    ]
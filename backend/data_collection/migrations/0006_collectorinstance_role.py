@@ -0,0 +1,22 @@
+# Generated by Django 4.2.12 on 2026-10-18 13:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("data_collection", "0005_backfillcheckpoint"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="collectorinstance",
+            name="reserved_rates",
+            field=models.JSONField(default=dict),
+        ),
+        migrations.AddField(
+            model_name="collectorinstance",
+            name="role",
+            field=models.CharField(default="collector", max_length=20),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.12 on 2026-10-18 13:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("data_collection", "0006_collectorinstance_role"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="JoinStateEntry",
+            fields=[
+                (
+                    "location",
+                    models.CharField(
+                        max_length=100, primary_key=True, serialize=False
+                    ),
+                ),
+                ("entry", models.JSONField()),
+                ("kafka_partition", models.IntegerField()),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["kafka_partition"],
+                        name="data_collec_kafka_p_1b37d0_idx",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.12 on 2026-10-18 13:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("data_collection", "0007_joinstateentry"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="processeddata",
+            name="window_start",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name="processeddata",
+            constraint=models.UniqueConstraint(
+                fields=("location", "window_start"),
+                name="processed_location_window_uniq",
+            ),
+        ),
+    ]
@@ -0,0 +1,108 @@
+# Generated by Django 4.2.12 on 2026-10-18 13:25
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("data_collection", "0008_processeddata_window"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LatestLocationFeatures",
+            fields=[
+                (
+                    "processed",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        primary_key=True,
+                        related_name="+",
+                        serialize=False,
+                        to="data_collection.processeddata",
+                    ),
+                ),
+                ("location", models.CharField(max_length=100)),
+                ("latitude", models.FloatField()),
+                ("longitude", models.FloatField()),
+                ("timestamp", models.DateTimeField()),
+                ("temperature", models.FloatField(null=True)),
+                ("humidity", models.FloatField(null=True)),
+                ("wind_speed", models.FloatField(null=True)),
+                ("pressure", models.FloatField(null=True)),
+                ("cloud_cover", models.FloatField(null=True)),
+                ("pm25", models.FloatField(null=True)),
+                ("pm10", models.FloatField(null=True)),
+                ("o3", models.FloatField(null=True)),
+                ("no2", models.FloatField(null=True)),
+                ("so2", models.FloatField(null=True)),
+                ("co", models.FloatField(null=True)),
+            ],
+            options={
+                "db_table": "data_collection_latest_location_features",
+                "managed": False,
+            },
+        ),
+        migrations.CreateModel(
+            name="LocationFeatures",
+            fields=[
+                (
+                    "processed",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="features",
+                        serialize=False,
+                        to="data_collection.processeddata",
+                    ),
+                ),
+                ("location", models.CharField(max_length=100)),
+                ("latitude", models.FloatField()),
+                ("longitude", models.FloatField()),
+                ("timestamp", models.DateTimeField()),
+                ("temperature", models.FloatField(null=True)),
+                ("humidity", models.FloatField(null=True)),
+                ("wind_speed", models.FloatField(null=True)),
+                ("pressure", models.FloatField(null=True)),
+                ("cloud_cover", models.FloatField(null=True)),
+                ("pm25", models.FloatField(null=True)),
+                ("pm10", models.FloatField(null=True)),
+                ("o3", models.FloatField(null=True)),
+                ("no2", models.FloatField(null=True)),
+                ("so2", models.FloatField(null=True)),
+                ("co", models.FloatField(null=True)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["location", "timestamp"],
+                        name="data_collec_locatio_d4b014_idx",
+                    ),
+                    models.Index(
+                        fields=["timestamp"],
+                        name="data_collec_timesta_b08d21_idx",
+                    ),
+                ],
+            },
+        ),
+        # Latest row of each location; filters on location are pushed into
+        # the window
+        migrations.RunSQL(
+            """
+            CREATE VIEW data_collection_latest_location_features AS
+            SELECT processed_id, location, latitude, longitude, "timestamp",
+                   temperature, humidity, wind_speed, pressure, cloud_cover,
+                   pm25, pm10, o3, no2, so2, co
+            FROM (
+                SELECT *, ROW_NUMBER() OVER (
+                    PARTITION BY location
+                    ORDER BY "timestamp" DESC, processed_id DESC
+                ) AS row_rank
+                FROM data_collection_locationfeatures
+            ) ranked
+            WHERE row_rank = 1
+            """,
+            "DROP VIEW IF EXISTS data_collection_latest_location_features",
+        ),
+    ]
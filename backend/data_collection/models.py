@@ -34,6 +34,8 @@ class ProcessedData(models.Model):
     latitude = models.FloatField()
     longitude = models.FloatField()
     timestamp = models.DateTimeField()
+    # Processing window, one row per location and window
+    window_start = models.DateTimeField(null=True, blank=True)
     processed_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
@@ -41,11 +43,86 @@ class ProcessedData(models.Model):
             models.Index(fields=['location']),
             models.Index(fields=['timestamp']),
         ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['location', 'window_start'],
+                name='processed_location_window_uniq'
+            ),
+        ]
         
     def __str__(self):
         return f"Processed data for {self.location} at {self.timestamp}"
 
 
+class LocationFeatures(models.Model):
+    """
+    Model features of a ProcessedData row as typed columns (the feature store).
+
+    Kept up to date by the processor as it stores processed data; NULL where
+    a reading is missing.
+    """
+    processed = models.OneToOneField(
+        ProcessedData, on_delete=models.CASCADE, primary_key=True,
+        related_name='features'
+    )
+    location = models.CharField(max_length=100)
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+    timestamp = models.DateTimeField()
+    temperature = models.FloatField(null=True)
+    humidity = models.FloatField(null=True)
+    wind_speed = models.FloatField(null=True)
+    pressure = models.FloatField(null=True)
+    cloud_cover = models.FloatField(null=True)
+    pm25 = models.FloatField(null=True)
+    pm10 = models.FloatField(null=True)
+    o3 = models.FloatField(null=True)
+    no2 = models.FloatField(null=True)
+    so2 = models.FloatField(null=True)
+    co = models.FloatField(null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['location', 'timestamp']),
+            models.Index(fields=['timestamp']),
+        ]
+
+    def __str__(self):
+        return f"Features for {self.location} at {self.timestamp}"
+
+
+class LatestLocationFeatures(models.Model):
+    """
+    Latest feature store row of each location (database view).
+    """
+    processed = models.OneToOneField(
+        ProcessedData, on_delete=models.DO_NOTHING, primary_key=True,
+        related_name='+'
+    )
+    location = models.CharField(max_length=100)
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+    timestamp = models.DateTimeField()
+    temperature = models.FloatField(null=True)
+    humidity = models.FloatField(null=True)
+    wind_speed = models.FloatField(null=True)
+    pressure = models.FloatField(null=True)
+    cloud_cover = models.FloatField(null=True)
+    pm25 = models.FloatField(null=True)
+    pm10 = models.FloatField(null=True)
+    o3 = models.FloatField(null=True)
+    no2 = models.FloatField(null=True)
+    so2 = models.FloatField(null=True)
+    co = models.FloatField(null=True)
+
+    class Meta:
+        managed = False
+        db_table = 'data_collection_latest_location_features'
+
+    def __str__(self):
+        return f"Latest features for {self.location} at {self.timestamp}"
+
+
 class Location(models.Model):
     """
     Model to store locations for data collection.
@@ -62,4 +139,121 @@ class Location(models.Model):
         unique_together = ('latitude', 'longitude')
         
     def __str__(self):
-        return f"{self.name}, {self.country}"
\ No newline at end of file
+        return f"{self.name}, {self.country}"
+
+
+class OpenAQStationCache(models.Model):
+    """
+    Model to persist the OpenAQ stations discovered around a location.
+    """
+    location = models.OneToOneField(
+        Location, on_delete=models.CASCADE, related_name='openaq_stations'
+    )
+    stations = models.JSONField(default=list)
+    fetched_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['fetched_at']),
+        ]
+
+    def __str__(self):
+        return f"OpenAQ stations near {self.location.name}"
+
+
+class OutboxMessage(models.Model):
+    """
+    Model to store Kafka messages written in the same transaction as their
+    data.
+
+    The outbox relay publishes pending rows and marks them as sent.
+    """
+    topic = models.CharField(max_length=255)
+    key = models.CharField(max_length=255)
+    payload = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['id'],
+                condition=models.Q(sent_at__isnull=True),
+                name='outbox_pending_idx'
+            ),
+            models.Index(fields=['sent_at']),
+        ]
+
+    def __str__(self):
+        return f"Outbox message {self.key} for {self.topic}"
+
+
+class CollectorInstance(models.Model):
+    """
+    Model to track the running producer instances sharing the collection work.
+
+    History backfills register too, with the request rates they take from
+    the collectors' budget.
+    """
+    instance_id = models.CharField(max_length=255, unique=True)
+    # 'collector' or 'backfill'
+    role = models.CharField(max_length=20, default='collector')
+    # Provider -> requests per second
+    reserved_rates = models.JSONField(default=dict)
+    heartbeat_at = models.DateTimeField()
+    started_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['heartbeat_at']),
+        ]
+
+    def __str__(self):
+        return f"Collector {self.instance_id}"
+
+
+class BackfillCheckpoint(models.Model):
+    """
+    Model to record the history ranges already backfilled for a location.
+    """
+    location = models.ForeignKey(
+        Location, on_delete=models.CASCADE,
+        related_name='backfill_checkpoints'
+    )
+    start_date = models.DateField()
+    end_date = models.DateField()
+    sink = models.CharField(max_length=20)  # 'db' or 'topic'
+    records = models.IntegerField(default=0)
+    completed_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['location', 'start_date']),
+        ]
+
+    def __str__(self):
+        return (
+            f"Backfill of {self.location.name} from {self.start_date} to "
+            f"{self.end_date}"
+        )
+
+
+class JoinStateEntry(models.Model):
+    """
+    Model to snapshot the processor's join state, one row per location.
+
+    Rows are tagged with the raw topic partition of their location, so a
+    processor on any host picks up the entries of the partitions it is
+    assigned.
+    """
+    location = models.CharField(max_length=100, primary_key=True)
+    entry = models.JSONField()
+    kafka_partition = models.IntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['kafka_partition']),
+        ]
+
+    def __str__(self):
+        return f"Join state of {self.location}"
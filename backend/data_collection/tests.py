@@ -0,0 +1,265 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from data_collection.backfill import HistoryBackfiller
+from data_collection.features import FEATURE_COLUMNS
+from data_collection.kafka.codec import (MAGIC_BYTE, PROCESSED_SCHEMA,
+                                         RAW_SCHEMA, RAW_SCHEMA_V1,
+                                         MessageCodec)
+from data_collection.kafka.http_client import ProviderClient
+from data_collection.kafka.producer import KafkaProducer
+from data_collection.kafka.scheduler import CollectionScheduler
+from data_collection.kafka.sharding import LocationSharder
+from data_collection.kafka.state import JoinStateStore
+
+pytestmark = pytest.mark.django_db
+
+MAX_AGE = {'weather': 3600, 'pollution': 93600}
+
+
+@pytest.fixture
+def state():
+    return JoinStateStore(max_age=MAX_AGE, max_entries=100)
+
+
+def test_late_reading_does_not_replace_newer_side(state):
+    state.add('Paris', 'weather', {'temperature': 20}, 2, 2000)
+    # Older weather reading arriving after the newer one
+    late = state.add('Paris', 'weather', {'temperature': 10}, 1, 1000)
+    assert late is None
+
+    entry = state.add('Paris', 'pollution', {'measurements': {}}, 3, 2100)
+    assert entry['weather']['raw_id'] == 2
+    assert entry['weather']['value'] == {'temperature': 20}
+
+
+def test_late_reading_is_not_flushed(state):
+    state.add('Paris', 'weather', {'temperature': 20}, 2, 2000)
+    state.flush()
+    state.add('Paris', 'weather', {'temperature': 10}, 1, 1000)
+    state.flush()
+
+    restored = JoinStateStore(max_age=MAX_AGE, max_entries=100)
+    restored.restore()
+    assert restored.entries['Paris']['weather']['raw_id'] == 2
+
+
+def test_handoff_restores_only_assigned_partitions(state):
+    state.add('Paris', 'weather', {'temperature': 20}, 1, 2000, partition=0)
+    state.add('Lyon', 'weather', {'temperature': 18}, 2, 2000, partition=1)
+    state.release([0, 1])
+    assert len(state) == 0
+
+    other = JoinStateStore(max_age=MAX_AGE, max_entries=100)
+    other.restore([1])
+    assert list(other.entries) == ['Lyon']
+
+
+def test_lost_partitions_do_not_overwrite_new_owner(state):
+    state.add('Paris', 'weather', {'temperature': 20}, 1, 2000, partition=0)
+    state.flush()
+    state.add('Paris', 'weather', {'temperature': 21}, 2, 3000, partition=0)
+
+    owner = JoinStateStore(max_age=MAX_AGE, max_entries=100)
+    owner.restore([0])
+    owner.add('Paris', 'weather', {'temperature': 22}, 3, 4000, partition=0)
+    owner.flush()
+
+    state.drop([0])
+    state.flush()
+    assert len(state) == 0
+
+    restored = JoinStateStore(max_age=MAX_AGE, max_entries=100)
+    restored.restore([0])
+    assert restored.entries['Paris']['weather']['raw_id'] == 3
+
+
+def test_retried_reading_skips_lateness_check(state):
+    state.add('Paris', 'weather', {'temperature': 20}, 2, 2000)
+    # Weather reading re-delivered by the retry worker
+    entry = state.add(
+        'Paris', 'weather', {'temperature': 10}, 1, 1000, retried=True
+    )
+    assert entry is None
+    assert state.entries['Paris']['weather']['raw_id'] == 1
+
+    entry = state.add('Paris', 'pollution', {'measurements': {}}, 3, 1100)
+    assert entry['weather']['raw_id'] == 1
+
+
+RAW_MESSAGE = {
+    'id': 1, 'source': 'openweather', 'location': 'Paris',
+    'latitude': 48.85, 'longitude': 2.35,
+    'timestamp': '2025-01-01T00:00:00+00:00', 'data': {'main': {'temp': 5}},
+    'backfill': False,
+}
+
+
+@pytest.mark.parametrize('wire_format', MessageCodec.FORMATS)
+def test_codec_round_trip(wire_format):
+    codec = MessageCodec(RAW_SCHEMA, wire_format)
+    assert codec.decode(codec.encode(RAW_MESSAGE)) == RAW_MESSAGE
+
+    batch = {
+        'ids': [1], 'locations': ['Paris'], 'latitudes': [48.85],
+        'longitudes': [2.35], 'timestamps': ['2025-01-01T00:00:00+00:00'],
+        'columns': list(FEATURE_COLUMNS),
+        'features': [[float(i) for i in range(len(FEATURE_COLUMNS))]],
+    }
+    codec = MessageCodec(PROCESSED_SCHEMA, wire_format)
+    assert codec.decode(codec.encode(batch)) == batch
+
+
+def test_codec_reads_older_raw_versions():
+    codec = MessageCodec(RAW_SCHEMA, 'msgpack')
+    legacy = {k: v for k, v in RAW_MESSAGE.items() if k != 'backfill'}
+
+    v1 = MessageCodec(RAW_SCHEMA_V1, 'msgpack').encode(legacy)
+    assert codec.decode(v1) == legacy
+    assert codec.decode(json.dumps(legacy).encode()) == legacy
+
+
+def test_codec_upgrades_legacy_processed_messages():
+    codec = MessageCodec(PROCESSED_SCHEMA, 'msgpack')
+    record = {
+        'id': 7, 'location': 'Paris', 'latitude': 48.85, 'longitude': 2.35,
+        'timestamp': '2025-01-01T00:00:00+00:00',
+        'weather': {'temperature': 12}, 'pollution': {'pm25': 8},
+    }
+    nested = {'id': 7, 'data': {k: v for k, v in record.items() if k != 'id'}}
+
+    for legacy in (record, nested):
+        message = codec.decode(json.dumps(legacy).encode())
+        assert message['ids'] == [7]
+        assert message['locations'] == ['Paris']
+        features = dict(zip(message['columns'], message['features'][0]))
+        assert features['temperature'] == 12
+        assert features['pm25'] == 8
+        assert features['humidity'] == 50  # Default of a missing reading
+
+
+@pytest.mark.parametrize('value', [
+    b'5', b'"text"', b'{broken', bytes([MAGIC_BYTE]),
+    bytes([MAGIC_BYTE, RAW_SCHEMA.version, 0x05]),
+    bytes([MAGIC_BYTE, 99, 0x90]),
+])
+def test_codec_rejects_invalid_payloads(value):
+    with pytest.raises(ValueError):
+        MessageCodec(RAW_SCHEMA, 'msgpack').decode(value)
+
+
+def test_scheduler_skips_stale_entries():
+    scheduler = CollectionScheduler({'openweather': (0, 0)})
+    scheduler.sync([1])
+    scheduler.sync([])
+    # Re-added before its old entry was popped
+    scheduler.sync([1])
+    assert scheduler.pop_due() == [(1, 'openweather')]
+    assert scheduler.pop_due() == []
+
+    scheduler.record(1, 'openweather', {'temp': 5})
+    scheduler.sync([])
+    assert scheduler.seconds_until_next() is None
+    assert scheduler.pop_due() == []
+
+
+def test_scheduler_backs_off_on_unchanged_payload():
+    scheduler = CollectionScheduler({'openaq': (10, 100)})
+    scheduler.sync([1])
+    scheduler.pop_due()
+
+    assert scheduler.record(1, 'openaq', {'pm25': 8})
+    assert scheduler.state[(1, 'openaq')]['interval'] == 10
+    assert not scheduler.record(1, 'openaq', {'pm25': 8})
+    assert scheduler.state[(1, 'openaq')]['interval'] == 15
+    assert scheduler.record(1, 'openaq', {'pm25': 9})
+    assert scheduler.state[(1, 'openaq')]['interval'] == 10
+    # Only the latest entry of the pair stays current
+    assert len([
+        entry for entry in scheduler.heap if scheduler._is_current(entry)
+    ]) == 1
+
+
+def test_sharder_moves_only_the_locations_of_changed_members():
+    members = ['a', 'b', 'c']
+    before = {
+        location: LocationSharder.owner(location, members)
+        for location in range(1000)
+    }
+    assert set(before.values()) == set(members)
+
+    joined = {
+        location: LocationSharder.owner(location, members + ['d'])
+        for location in before
+    }
+    assert all(
+        joined[location] in (owner, 'd')
+        for location, owner in before.items()
+    )
+
+    left = {
+        location: LocationSharder.owner(location, ['a', 'b'])
+        for location in before
+    }
+    assert all(
+        left[location] == owner
+        for location, owner in before.items() if owner != 'c'
+    )
+
+
+def test_sharder_splits_locations_between_live_instances():
+    locations = [SimpleNamespace(id=location) for location in range(100)]
+    sharders = [LocationSharder(instance_id=name) for name in ('a', 'b')]
+    for sharder in sharders:
+        sharder.heartbeat()
+
+    owned = [
+        {location.id for location in sharder.assign(locations)}
+        for sharder in sharders
+    ]
+    assert owned[0].isdisjoint(owned[1])
+    assert owned[0] | owned[1] == set(range(100))
+
+
+def test_collectors_split_the_provider_rate():
+    sharder = LocationSharder(instance_id='a')
+    client = ProviderClient('openaq', 'https://example.org', 1.0, 1, 1)
+    producer = SimpleNamespace(sharder=sharder, clients={'openaq': client})
+
+    sharder.members = ['a', 'b']
+    KafkaProducer.apply_rates(producer)
+    assert client.rate_limiter.rate == pytest.approx(0.5)
+
+    sharder.members = ['a', 'b', 'c', 'd']
+    KafkaProducer.apply_rates(producer)
+    assert client.rate_limiter.rate == pytest.approx(0.25)
+
+
+def test_backfill_reservation_is_taken_from_the_collectors():
+    sharder = LocationSharder(instance_id='a')
+    client = ProviderClient('openaq', 'https://example.org', 1.0, 1, 1)
+    producer = SimpleNamespace(sharder=sharder, clients={'openaq': client})
+    LocationSharder(
+        instance_id='backfill', role='backfill',
+        reserved_rates={'openaq': 0.2}
+    ).heartbeat()
+
+    sharder.members = ['a', 'b']
+    KafkaProducer.apply_rates(producer)
+    assert client.rate_limiter.rate == pytest.approx(0.4)
+
+
+def test_only_one_backfill_runs_at_a_time():
+    first = HistoryBackfiller()
+    first.claim()
+    try:
+        with pytest.raises(RuntimeError):
+            HistoryBackfiller().claim()
+    finally:
+        first.sharder.stop()
+
+    second = HistoryBackfiller()
+    second.claim()
+    second.sharder.stop()
@@ -157,16 +157,153 @@ RESEND_API_KEY = os.environ.get('RESEND_API_KEY')
 KAFKA_BOOTSTRAP_SERVERS = os.environ.get('KAFKA_BOOTSTRAP_SERVERS', 'kafka:29092')
 KAFKA_RAW_DATA_TOPIC = os.environ.get('KAFKA_RAW_DATA_TOPIC', 'raw_pollution_weather_data')
 KAFKA_PROCESSED_DATA_TOPIC = os.environ.get('KAFKA_PROCESSED_DATA_TOPIC', 'processed_pollution_weather_data')
+# Producer profile: 'throughput' batches, compresses and deduplicates;
+# 'default' uses librdkafka defaults
+KAFKA_PRODUCER_PROFILE = os.environ.get('KAFKA_PRODUCER_PROFILE', 'throughput')
+KAFKA_PRODUCER_LINGER_MS = int(os.environ.get('KAFKA_PRODUCER_LINGER_MS', 20))
+# Bytes
+KAFKA_PRODUCER_BATCH_SIZE = int(
+    os.environ.get('KAFKA_PRODUCER_BATCH_SIZE', 262144)
+)
+# lz4, zstd, snappy, gzip or none
+KAFKA_PRODUCER_COMPRESSION = os.environ.get(
+    'KAFKA_PRODUCER_COMPRESSION', 'lz4'
+)
+KAFKA_PRODUCER_IDEMPOTENCE = (
+    os.environ.get('KAFKA_PRODUCER_IDEMPOTENCE', 'True') == 'True'
+)
+# 0 disables producer stats
+KAFKA_STATS_INTERVAL_MS = int(os.environ.get('KAFKA_STATS_INTERVAL_MS', 60000))
+# Wire format of the pipeline topics: 'msgpack' or 'json'. Consumers read both,
+# so switch producers back to 'json' if older consumers are still running.
+KAFKA_WIRE_FORMAT = os.environ.get('KAFKA_WIRE_FORMAT', 'msgpack')
+# Seconds, one retry topic each
+KAFKA_RETRY_DELAYS = [
+    int(delay)
+    for delay in os.environ.get('KAFKA_RETRY_DELAYS', '60,600,3600').split(',')
+]
+# Raw messages reference RawData instead of embedding the payload
+KAFKA_CLAIM_CHECK = os.environ.get('KAFKA_CLAIM_CHECK', 'True') == 'True'
+
+# Processor settings
+# Messages consumed per micro-batch
+PROCESSOR_BATCH_SIZE = int(os.environ.get('PROCESSOR_BATCH_SIZE', 500))
+# Seconds to wait for a full batch
+PROCESSOR_BATCH_TIMEOUT = float(os.environ.get('PROCESSOR_BATCH_TIMEOUT', 1))
+# Processes consuming the raw topic in parallel
+PROCESSOR_WORKERS = int(os.environ.get('PROCESSOR_WORKERS', 1))
+# Kafka transactions for read-process-write
+PROCESSOR_EXACTLY_ONCE = (
+    os.environ.get('PROCESSOR_EXACTLY_ONCE', 'True') == 'True'
+)
+# One ProcessedData row per location and window
+PROCESSED_WINDOW_SECONDS = int(os.environ.get('PROCESSED_WINDOW_SECONDS', 300))
+# Maximum age (seconds) of a reading for it to be joined with the other source
+JOIN_WEATHER_MAX_AGE = int(os.environ.get('JOIN_WEATHER_MAX_AGE', 3600))
+# OpenAQ measurements are daily
+JOIN_POLLUTION_MAX_AGE = int(os.environ.get('JOIN_POLLUTION_MAX_AGE', 93600))
+JOIN_STATE_MAX_LOCATIONS = int(
+    os.environ.get('JOIN_STATE_MAX_LOCATIONS', 10000)
+)
 
 # API keys
 OPENWEATHER_API_KEY = os.environ.get('OPENWEATHER_API_KEY')
 OPENAQ_API_KEY = os.environ.get('OPENAQ_API_KEY')
 
+# Data collection settings
+# Total concurrent upstream requests
+COLLECTOR_MAX_WORKERS = int(os.environ.get('COLLECTOR_MAX_WORKERS', 16))
+OPENWEATHER_CONCURRENCY = int(os.environ.get('OPENWEATHER_CONCURRENCY', 8))
+OPENAQ_CONCURRENCY = int(os.environ.get('OPENAQ_CONCURRENCY', 4))
+# Seconds
+HTTP_CONNECT_TIMEOUT = float(os.environ.get('HTTP_CONNECT_TIMEOUT', 5))
+HTTP_READ_TIMEOUT = float(os.environ.get('HTTP_READ_TIMEOUT', 20))  # Seconds
+# Token bucket rate limits (requests per second, burst size), shared by all
+# the collector replicas
+# Free plan: 60 calls/minute
+OPENWEATHER_RATE_LIMIT = float(os.environ.get('OPENWEATHER_RATE_LIMIT', 1))
+OPENWEATHER_RATE_BURST = int(os.environ.get('OPENWEATHER_RATE_BURST', 10))
+# 60 calls/minute, 2000 calls/hour
+OPENAQ_RATE_LIMIT = float(os.environ.get('OPENAQ_RATE_LIMIT', 0.5))
+OPENAQ_RATE_BURST = int(os.environ.get('OPENAQ_RATE_BURST', 10))
+# 7 days in seconds
+OPENAQ_STATION_CACHE_TTL = int(
+    os.environ.get('OPENAQ_STATION_CACHE_TTL', 604800)
+)
+COLLECTOR_WRITE_BATCH_SIZE = int(
+    os.environ.get('COLLECTOR_WRITE_BATCH_SIZE', 100)
+)
+# Seconds
+COLLECTOR_LOCATION_REFRESH_INTERVAL = int(
+    os.environ.get('COLLECTOR_LOCATION_REFRESH_INTERVAL', 30)
+)
+# Seconds
+COLLECTOR_HEARTBEAT_INTERVAL = int(
+    os.environ.get('COLLECTOR_HEARTBEAT_INTERVAL', 10)
+)
+# Seconds without heartbeat before an instance is considered dead
+COLLECTOR_INSTANCE_TTL = int(os.environ.get('COLLECTOR_INSTANCE_TTL', 45))
+# Polling interval bounds per source (seconds), adapted to how often upstream
+# data changes
+OPENWEATHER_MIN_INTERVAL = int(os.environ.get('OPENWEATHER_MIN_INTERVAL', 300))
+OPENWEATHER_MAX_INTERVAL = int(
+    os.environ.get('OPENWEATHER_MAX_INTERVAL', 1800)
+)
+OPENAQ_MIN_INTERVAL = int(os.environ.get('OPENAQ_MIN_INTERVAL', 3600))
+OPENAQ_MAX_INTERVAL = int(os.environ.get('OPENAQ_MAX_INTERVAL', 21600))
+
+# History backfill settings. The backfill rates are taken from the live rate
+# limits while a backfill runs, and must stay below them.
+BACKFILL_CHUNK_DAYS = int(os.environ.get('BACKFILL_CHUNK_DAYS', 7))
+BACKFILL_WORKERS = int(os.environ.get('BACKFILL_WORKERS', 4))
+# Requests per second
+BACKFILL_OPENWEATHER_RATE_LIMIT = float(
+    os.environ.get('BACKFILL_OPENWEATHER_RATE_LIMIT', 0.2)
+)
+# Requests per second
+BACKFILL_OPENAQ_RATE_LIMIT = float(
+    os.environ.get('BACKFILL_OPENAQ_RATE_LIMIT', 0.1)
+)
+
+# Outbox relay settings
+OUTBOX_BATCH_SIZE = int(os.environ.get('OUTBOX_BATCH_SIZE', 1000))
+# Seconds
+OUTBOX_POLL_INTERVAL = float(os.environ.get('OUTBOX_POLL_INTERVAL', 1))
+# Seconds
+OUTBOX_FLUSH_TIMEOUT = float(os.environ.get('OUTBOX_FLUSH_TIMEOUT', 30))
+OUTBOX_RETENTION_HOURS = int(os.environ.get('OUTBOX_RETENTION_HOURS', 24))
+
 # Model settings
 MODELS_DIR = BASE_DIR / 'models'
 REMOTE_MODEL_URL = os.environ.get('REMOTE_MODEL_URL')
 SUPABASE_API_KEY = os.environ.get('SUPABASE_API_KEY')
 MODEL_UPDATE_INTERVAL = int(os.environ.get('MODEL_UPDATE_INTERVAL', 86400))  # 24 hours in seconds
+# Seconds between job queue checks
+TRAINING_POLL_INTERVAL = float(os.environ.get('TRAINING_POLL_INTERVAL', 5))
+# Seconds between heartbeats of a running job
+TRAINING_HEARTBEAT_INTERVAL = float(
+    os.environ.get('TRAINING_HEARTBEAT_INTERVAL', 30)
+)
+# Seconds without a heartbeat before a running job is considered abandoned
+TRAINING_JOB_TIMEOUT = float(os.environ.get('TRAINING_JOB_TIMEOUT', 300))
+# Runs of a job before an abandoned job is failed instead of requeued
+TRAINING_JOB_MAX_ATTEMPTS = int(
+    os.environ.get('TRAINING_JOB_MAX_ATTEMPTS', 2)
+)
+# Rows fetched per query round trip while reading training data
+TRAINING_CHUNK_SIZE = int(os.environ.get('TRAINING_CHUNK_SIZE', 10000))
+# Seconds between active model checks
+MODEL_REFRESH_INTERVAL = float(os.environ.get('MODEL_REFRESH_INTERVAL', 30))
+# Deserialized models kept per process
+MODEL_CACHE_SIZE = int(os.environ.get('MODEL_CACHE_SIZE', 2))
+# Serve tree models from compiled node arrays
+MODEL_COMPILE = os.environ.get('MODEL_COMPILE', 'True') == 'True'
+# Memory-map compiled models, sharing their pages between processes
+MODEL_MMAP = os.environ.get('MODEL_MMAP', 'True') == 'True'
+# Messages scored per batch
+PREDICTION_BATCH_SIZE = int(os.environ.get('PREDICTION_BATCH_SIZE', 500))
+# Seconds to wait for a full batch
+PREDICTION_BATCH_TIMEOUT = float(os.environ.get('PREDICTION_BATCH_TIMEOUT', 2))
 
 # Pollution threshold
 DEFAULT_POLLUTION_THRESHOLD = int(os.environ.get('DEFAULT_POLLUTION_THRESHOLD', 50))
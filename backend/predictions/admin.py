@@ -1,6 +1,7 @@
 from django.contrib import admin
 
-from .models import ModelTrainingHistory, Prediction, PredictionModel
+from .models import (ModelTrainingHistory, Prediction, PredictionModel,
+                     TrainingJob)
 
 
 @admin.register(PredictionModel)
@@ -25,4 +26,16 @@ class ModelTrainingHistoryAdmin(admin.ModelAdmin):
     list_display = ('model', 'training_data_start', 'training_data_end', 'improvement', 'remote_updated', 'created_at')
     list_filter = ('model', 'remote_updated')
     search_fields = ('model__name',)
-    readonly_fields = ('created_at',)
\ No newline at end of file
+    readonly_fields = ('created_at',)
+
+
+@admin.register(TrainingJob)
+class TrainingJobAdmin(admin.ModelAdmin):
+    list_display = (
+        'id', 'days', 'requested_by', 'status', 'created_at', 'started_at',
+        'finished_at'
+    )
+    list_filter = ('status', 'requested_by')
+    readonly_fields = (
+        'created_at', 'started_at', 'heartbeat_at', 'finished_at'
+    )
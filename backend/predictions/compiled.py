@@ -0,0 +1,337 @@
+import json
+import os
+import shutil
+
+import joblib
+import numpy as np
+from loguru import logger
+
+# Arrays of a compiled forest, one .npy file each
+NODE_ARRAYS = (
+    'feature', 'threshold', 'children', 'missing', 'value', 'roots'
+)
+
+# XGBoost objectives whose prediction is the raw sum of the leaves
+XGBOOST_IDENTITY_OBJECTIVES = (
+    'reg:squarederror', 'reg:absoluteerror', 'reg:pseudohubererror',
+    'reg:quantileerror'
+)
+
+
+def compiled_path(file_path):
+    """Directory holding the compiled arrays of a model artifact."""
+    return f"{os.path.splitext(file_path)[0]}.compiled"
+
+
+def round_down(thresholds):
+    """Largest float32 values below or equal to float64 thresholds.
+
+    Estimators compare float32 features, so ``x <= t`` and
+    ``x <= round_down(t)`` agree for every float32 ``x``.
+    """
+    rounded = thresholds.astype(np.float32)
+    above = rounded.astype(np.float64) > thresholds
+    rounded[above] = np.nextafter(rounded[above], np.float32(-np.inf))
+    return rounded
+
+
+class CompiledForest:
+    """
+    Tree ensemble flattened into contiguous node arrays, evaluated for a
+    whole batch with NumPy.
+
+    Every node sends a row to its left child (``children[node, 0]``) when
+    its ``feature`` is below or equal to ``threshold``, to ``missing`` when
+    it is NaN, and to its right child (``children[node, 1]``) otherwise.
+    Leaves point to themselves with an infinite threshold. The prediction is
+    the mean (forests) or the sum plus ``base_score`` (boosting) of the leaf
+    values.
+    """
+
+    def __init__(self, feature, threshold, children, missing, value, roots,
+                 depth, n_features_in_, aggregate='mean', base_score=0.0,
+                 source=''):
+        self.feature = feature
+        self.threshold = threshold
+        self.children = children
+        self.missing = missing
+        self.value = value
+        self.roots = roots
+        self.depth = depth
+        self.n_features_in_ = n_features_in_
+        self.aggregate = aggregate
+        self.base_score = base_score
+        self.source = source
+
+    @classmethod
+    def from_trees(cls, trees, n_features_in_, **kwargs):
+        """Concatenate trees given as (feature, threshold, left, right,
+        missing, value) arrays, with children indices local to the tree and
+        -1 for leaves."""
+        arrays = {name: [] for name in NODE_ARRAYS}
+        offset = 0
+        for feature, threshold, left, right, missing, value in trees:
+            count = len(feature)
+            index = np.arange(count)
+            leaf = left < 0
+            arrays['feature'].append(
+                np.where(leaf, 0, feature).astype(np.int32)
+            )
+            arrays['threshold'].append(
+                np.where(leaf, np.float32(np.inf), threshold)
+                .astype(np.float32)
+            )
+            left, right, missing = (
+                (np.where(leaf, index, nodes) + offset).astype(np.int32)
+                for nodes in (left, right, missing)
+            )
+            arrays['children'].append(np.stack([left, right], axis=1))
+            arrays['missing'].append(missing)
+            arrays['value'].append(np.asarray(value, dtype=np.float32))
+            arrays['roots'].append(np.array([offset], dtype=np.int32))
+            offset += count
+
+        arrays = {
+            name: np.ascontiguousarray(np.concatenate(parts))
+            for name, parts in arrays.items()
+        }
+        return cls(
+            **arrays, depth=cls.tree_depth(arrays),
+            n_features_in_=n_features_in_, **kwargs
+        )
+
+    @staticmethod
+    def tree_depth(arrays):
+        """Levels to walk down before every row of every tree is on a leaf."""
+        depth = 0
+        nodes = arrays['roots']
+        while True:
+            nodes = nodes[arrays['children'][nodes, 0] != nodes]
+            if not len(nodes):
+                return depth
+            nodes = np.unique(np.concatenate([
+                arrays['children'][nodes].ravel(), arrays['missing'][nodes]
+            ]))
+            depth += 1
+
+    def predict(self, X):
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        flat = X.ravel()
+        has_missing = np.isnan(flat).any()
+        children = self.children.reshape(-1)
+        trees = len(self.roots)
+
+        # Current node of every (sample, tree) pair, and the pairs not on a
+        # leaf yet
+        node = np.tile(self.roots, len(X))
+        row_offset = np.repeat(
+            np.arange(len(X), dtype=np.intp) * X.shape[1], trees
+        )
+        active = np.arange(len(node))
+        for _ in range(self.depth):
+            current = node[active]
+            x = flat[row_offset[active] + self.feature[current]]
+            child = children[2 * current + (x > self.threshold[current])]
+            if has_missing:
+                child = np.where(
+                    np.isnan(x), self.missing[current], child
+                )
+            node[active] = child
+            active = active[child != current]
+            if not len(active):
+                break
+
+        leaves = self.value[node].reshape(len(X), trees).sum(
+            axis=1, dtype=np.float64
+        )
+        if self.aggregate == 'mean':
+            return leaves / trees
+        return leaves + self.base_score
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in NODE_ARRAYS)
+
+    def save(self, path, scaler=None):
+        """Write the arrays as .npy files in ``path``, which can then be
+        memory-mapped, along with the scaler of the model if it has one."""
+        # Several processes may compile the same model at once
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        for name in NODE_ARRAYS:
+            np.save(
+                os.path.join(tmp_path, f"{name}.npy"), getattr(self, name)
+            )
+        with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+            json.dump({
+                'depth': self.depth,
+                'n_features_in_': self.n_features_in_,
+                'aggregate': self.aggregate,
+                'base_score': self.base_score,
+                'source': self.source,
+            }, f)
+        if scaler is not None:
+            joblib.dump(scaler, os.path.join(tmp_path, 'scaler.joblib'))
+
+        # Readers never see a partly written directory. Processes that mapped
+        # the previous files keep reading them until they unmap them.
+        old_path = f"{tmp_path}.old"
+        if os.path.isdir(path):
+            os.rename(path, old_path)
+        os.rename(tmp_path, path)
+        shutil.rmtree(old_path, ignore_errors=True)
+
+    @classmethod
+    def load(cls, path, mmap_mode=None):
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        arrays = {
+            name: np.load(
+                os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode
+            )
+            for name in NODE_ARRAYS
+        }
+        return cls(**arrays, **meta)
+
+
+def compile_sklearn_forest(forest):
+    if getattr(forest, 'n_outputs_', 1) != 1:
+        raise ValueError("Only single-output forests can be compiled")
+
+    trees = []
+    for estimator in forest.estimators_:
+        tree = estimator.tree_
+        missing_left = getattr(tree, 'missing_go_to_left', None)
+        missing = tree.children_right if missing_left is None else np.where(
+            missing_left.astype(bool), tree.children_left, tree.children_right
+        )
+        trees.append((
+            tree.feature,
+            round_down(tree.threshold),
+            tree.children_left,
+            tree.children_right,
+            missing,
+            tree.value[:, 0, 0],
+        ))
+    return CompiledForest.from_trees(
+        trees, int(forest.n_features_in_), aggregate='mean',
+        source=type(forest).__name__
+    )
+
+
+def compile_xgboost(model):
+    booster = model.get_booster() if hasattr(model, 'get_booster') else model
+    config = json.loads(booster.save_config())
+    learner = config['learner']
+    booster_name = learner['gradient_booster']['name']
+    if booster_name != 'gbtree':
+        raise ValueError(f"Cannot compile {booster_name} boosters")
+    objective = learner['objective']['name']
+    if objective not in XGBOOST_IDENTITY_OBJECTIVES:
+        raise ValueError(f"Cannot compile objective {objective}")
+    base_score = float(
+        learner['learner_model_param']['base_score'].strip('[]')
+    )
+
+    frame = booster.trees_to_dataframe()
+    if 'Category' in frame and frame['Category'].notna().any():
+        raise ValueError("Cannot compile categorical splits")
+
+    # Trees used by predict when training stopped early
+    best_iteration = booster.attr('best_iteration')
+    if best_iteration is not None:
+        parallel = int(
+            learner['gradient_booster']['gbtree_model_param']
+            ['num_parallel_tree']
+        )
+        frame = frame[frame['Tree'] < (int(best_iteration) + 1) * parallel]
+
+    names = booster.feature_names or [
+        f"f{i}" for i in range(booster.num_features())
+    ]
+    feature_index = {name: i for i, name in enumerate(names)}
+
+    trees = []
+    for _, nodes in frame.groupby('Tree', sort=True):
+        local = {node_id: i for i, node_id in enumerate(nodes['ID'])}
+        leaf = (nodes['Feature'] == 'Leaf').to_numpy()
+
+        def children(column):
+            return np.array([
+                -1 if is_leaf else local[child]
+                for child, is_leaf in zip(nodes[column], leaf)
+            ])
+
+        split = nodes['Split'].to_numpy(dtype=np.float64).astype(np.float32)
+        trees.append((
+            np.array([
+                0 if is_leaf else feature_index[name]
+                for name, is_leaf in zip(nodes['Feature'], leaf)
+            ]),
+            # XGBoost sends x < split to the left: the same as x <= the
+            # float32 just below
+            np.where(
+                leaf, np.float32(np.inf),
+                np.nextafter(split, np.float32(-np.inf))
+            ),
+            children('Yes'),
+            children('No'),
+            children('Missing'),
+            np.where(leaf, nodes['Gain'].to_numpy(dtype=np.float64), 0.0),
+        ))
+    return CompiledForest.from_trees(
+        trees, booster.num_features(), aggregate='sum',
+        base_score=base_score, source=type(model).__name__
+    )
+
+
+def compile_model(model):
+    """Compile a fitted forest or XGBoost model. Raises ValueError if it is
+    not supported."""
+    if isinstance(model, CompiledForest):
+        return model
+    if (hasattr(model, 'estimators_') and hasattr(model, 'n_outputs_') and
+            not hasattr(model, 'predict_proba')):
+        return compile_sklearn_forest(model)
+    if hasattr(model, 'get_booster') or type(model).__name__ == 'Booster':
+        return compile_xgboost(model)
+    raise ValueError(f"Cannot compile {type(model).__name__} models")
+
+
+def artifact_model(data):
+    """Model and scaler of a loaded artifact: local models are saved with
+    their scaler, remote ones are the bare model (scaler None)."""
+    if isinstance(data, dict):
+        return data.get('model'), data.get('scaler')
+    return data, None
+
+
+def compile_artifact(file_path, model=None, scaler=None, mmap_mode=None):
+    """Compile a model artifact next to it, with its scaler. Returns the
+    compiled model, read back from the written files with ``mmap_mode`` if it
+    is given."""
+    if model is None:
+        model, scaler = artifact_model(joblib.load(file_path))
+
+    compiled = compile_model(model)
+    path = compiled_path(file_path)
+    compiled.save(path, scaler)
+
+    logger.info(
+        f"Compiled {compiled.source} into {path} "
+        f"({compiled.nbytes / 1e6:.1f} MB)"
+    )
+    if mmap_mode:
+        compiled, _ = load_artifact(path, mmap_mode)
+    return compiled
+
+
+def load_artifact(path, mmap_mode=None):
+    """Compiled model and scaler (None if there is none) from a compiled
+    directory."""
+    scaler_path = os.path.join(path, 'scaler.joblib')
+    scaler = joblib.load(scaler_path) if os.path.exists(scaler_path) else None
+    return CompiledForest.load(path, mmap_mode=mmap_mode), scaler
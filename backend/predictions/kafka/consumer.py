@@ -1,14 +1,18 @@
-import json
 from datetime import timedelta
 
-import pandas as pd
+import numpy as np
 from confluent_kafka import Consumer
 from django.conf import settings
 from django.utils import timezone
 from loguru import logger
 import xgboost
 
+from data_collection.features import align_frame
+from data_collection.kafka.client import ProducerPoller, build_producer
+from data_collection.kafka.codec import PROCESSED_SCHEMA, MessageCodec
+from data_collection.kafka.dead_letter import DeadLetterRouter
 from predictions.services import ModelService
+from predictions.training import enqueue_training
 
 
 class KafkaConsumer:
@@ -17,9 +21,17 @@ class KafkaConsumer:
         self.consumer = Consumer({
             'bootstrap.servers': settings.KAFKA_BOOTSTRAP_SERVERS,
             'group.id': 'model-consumer',
-            'auto.offset.reset': 'latest'
+            'auto.offset.reset': 'latest',
+            # Skip messages of aborted processor transactions
+            'isolation.level': 'read_committed'
         })
         self.consumer.subscribe([settings.KAFKA_PROCESSED_DATA_TOPIC])
+        self.codec = MessageCodec(PROCESSED_SCHEMA)
+
+        # Failed messages go to the retry and dead-letter topics
+        self.producer, self.producer_stats = build_producer('model-consumer')
+        self.poller = ProducerPoller(self.producer)
+        self.router = DeadLetterRouter(self.producer)
         
         # Initialize model service
         self.model_service = ModelService()
@@ -27,39 +39,62 @@ class KafkaConsumer:
         # Track when we last trained the model
         self.last_training = timezone.now()
     
-    def process_message(self, message):
-        """Process a message from Kafka."""
-        logger.debug("Start processing")
+    def process_batch(self, messages):
+        """Score the records of a batch of messages with a single model call.
+
+        Features come straight from the messages; when a location appears
+        several times, only its latest record is scored.
+        """
+        latest = {}  # location -> (timestamp, features, latitude, longitude)
+        decoded = []
+        for message in messages:
+            if message.error():
+                logger.error(f"Consumer error: {message.error()}")
+                continue
+
+            try:
+                data = self.codec.decode(message.value())
+                features = align_frame(data['features'], data['columns'])
+            except (KeyError, TypeError, ValueError) as e:
+                logger.error(f"Error decoding message: {e}")
+                self.router.route(message, e, retriable=False)
+                continue
+
+            decoded.append(message)
+            for row, location, latitude, longitude, timestamp in zip(
+                features, data['locations'], data['latitudes'],
+                data['longitudes'], data['timestamps']
+            ):
+                timestamp = timestamp or ''
+                if location not in latest or timestamp >= latest[location][0]:
+                    latest[location] = (timestamp, row, latitude, longitude)
+
+        if not latest:
+            return 0
+
+        locations = list(latest)
         try:
-            # Parse message
-            data = json.loads(message.value())
-            
-            # Extract the DataFrame
-            if 'dataframe' in data:
-                logger.debug("Getting the data frame")
-
-                df_json = data['dataframe']
-                df = pd.read_json(df_json, orient='records')
-                
-                # Use the data for predictions
-                location = data['data']['location']
-                
-                # Make prediction
-                prediction = self.model_service.make_prediction(location)
-                
-                if prediction:
-                    logger.info(f"Made prediction for {location}: {prediction['prediction']}")
-                
-                # Check if we should train the model
-                self.check_and_train_model()
-            
-        except json.JSONDecodeError as e:
-            logger.error(f"Error decoding message: {e}")
+            predictions = self.model_service.predict_frame(
+                np.array([latest[location][1] for location in locations]),
+                locations,
+                [latest[location][2] for location in locations],
+                [latest[location][3] for location in locations]
+            )
         except Exception as e:
-            logger.error(f"Error processing message: {e}")
+            logger.error(f"Error making predictions: {e}")
+            for message in decoded:
+                self.router.route(message, e)
+            return 0
+
+        logger.info(
+            f"Made {len(predictions)} predictions for {len(locations)} "
+            "locations"
+        )
+        return len(predictions)
     
     def check_and_train_model(self):
-        """Check if we should train the model based on time interval."""
+        """Queue a training job for the training worker based on time
+        interval."""
         now = timezone.now()
         interval = timedelta(seconds=settings.MODEL_UPDATE_INTERVAL)
         
@@ -67,7 +102,7 @@ class KafkaConsumer:
             logger.info("Training model based on scheduled interval")
             
             # Train model with data from the last 30 days
-            self.model_service.train_model(days=30)
+            enqueue_training(days=30, requested_by='schedule')
             
             # Update last training time
             self.last_training = now
@@ -75,22 +110,26 @@ class KafkaConsumer:
     def run(self):
         """Main method to run the consumer service."""
         logger.info("Starting Kafka Consumer for model predictions")
-        
+        self.poller.start()
+
         while True:
             try:
-                # Poll for messages
-                msg = self.consumer.poll(1.0)
-                
-                if msg is None:
-                    continue
-                
-                if msg.error():
-                    logger.error(f"Consumer error: {msg.error()}")
+                # Collect a batch of messages over a short window
+                messages = self.consumer.consume(
+                    settings.PREDICTION_BATCH_SIZE,
+                    settings.PREDICTION_BATCH_TIMEOUT
+                )
+                # Pick up a model activated by the training worker
+                self.model_service.refresh_model()
+
+                if not messages:
                     continue
-                
-                # Process the message
-                self.process_message(msg)
-                logger.debug("finish")
+
+                self.process_batch(messages)
+                self.codec.log_stats()
+
+                # Check if we should train the model
+                self.check_and_train_model()
 
             except Exception as e:
-                logger.error(f"Error in consumer service: {e}")
\ No newline at end of file
+                logger.error(f"Error in consumer service: {e}")
@@ -0,0 +1,41 @@
+import os
+
+from django.core.management.base import BaseCommand
+
+from predictions.compiled import compile_artifact
+from predictions.models import PredictionModel
+
+
+class Command(BaseCommand):
+    help = (
+        'Compile model artifacts into flat node arrays served by the '
+        'prediction processes'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Compile every model instead of the active one'
+        )
+
+    def handle(self, *args, **options):
+        models = PredictionModel.objects.order_by('-created_at')
+        if not options['all']:
+            models = models.filter(is_active=True)[:1]
+
+        for model_obj in models:
+            if not os.path.exists(model_obj.file_path):
+                self.stderr.write(
+                    f'{model_obj}: file {model_obj.file_path} not found'
+                )
+                continue
+            try:
+                compiled = compile_artifact(model_obj.file_path)
+            except ValueError as e:
+                self.stderr.write(f'{model_obj}: {e}')
+                continue
+            self.stdout.write(
+                f'{model_obj}: {len(compiled.roots)} trees, '
+                f'{len(compiled.feature)} nodes, '
+                f'{compiled.nbytes / 1e6:.1f} MB'
+            )
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from loguru import logger
+
+from predictions.training import TrainingWorker
+
+
+class Command(BaseCommand):
+    help = 'Run the training worker to train models from the job queue'
+
+    def handle(self, *args, **options):
+        logger.info('Starting training worker')
+        worker = TrainingWorker()
+        worker.run()
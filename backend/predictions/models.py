@@ -60,4 +60,41 @@ class ModelTrainingHistory(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     
     def __str__(self):
-        return f"Training for {self.model} at {self.created_at}"
\ No newline at end of file
+        return f"Training for {self.model} at {self.created_at}"
+
+
+class TrainingJob(models.Model):
+    """
+    Model training request, run by the training worker.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    ]
+
+    days = models.PositiveIntegerField(default=30)  # Days of data to train on
+    requested_by = models.CharField(max_length=50)  # 'schedule' or 'manual'
+    status = models.CharField(
+        max_length=20, choices=STATUS_CHOICES, default='pending'
+    )
+    history = models.ForeignKey(
+        ModelTrainingHistory, on_delete=models.SET_NULL, null=True,
+        blank=True, related_name='jobs'
+    )
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # Refreshed by the worker while the job runs
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"Training job {self.id} ({self.status})"
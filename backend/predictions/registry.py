@@ -0,0 +1,135 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import joblib
+from django.conf import settings
+from loguru import logger
+
+from .compiled import (artifact_model, compile_artifact, compiled_path,
+                       load_artifact)
+from .models import PredictionModel
+
+
+@dataclass
+class LoadedModel:
+    """A deserialized model with the scaler it was trained with (None for
+    remote models)."""
+    id: int
+    label: str
+    model: object
+    scaler: object = None
+
+
+class ModelRegistry:
+    """
+    Deserialized models of this process, keyed by PredictionModel id.
+
+    The active model id is the version stamp: it is read with a single
+    indexed query at most every MODEL_REFRESH_INTERVAL seconds, and a model
+    file is only loaded when the stamp points to a model missing from the
+    cache. The cache keeps the MODEL_CACHE_SIZE most recently used models.
+
+    With MODEL_COMPILE, models are served from their compiled arrays, read
+    from the compiled directory of the artifact or compiled after loading it.
+    With MODEL_MMAP the arrays are memory-mapped read-only: every process of
+    the node serving a model shares the same physical pages.
+    """
+
+    def __init__(self, size=None, refresh_interval=None):
+        self.size = size or settings.MODEL_CACHE_SIZE
+        self.refresh_interval = (
+            settings.MODEL_REFRESH_INTERVAL if refresh_interval is None
+            else refresh_interval
+        )
+        self.models = OrderedDict()  # PredictionModel id -> LoadedModel
+        self.active_id = None
+        self.checked_at = None
+        self.lock = threading.Lock()
+
+    def active_stamp(self):
+        """Id of the active model, read from the database when the last
+        check is too old."""
+        now = time.monotonic()
+        if (self.checked_at is None or
+                now - self.checked_at >= self.refresh_interval):
+            self.active_id = (
+                PredictionModel.objects.filter(is_active=True)
+                .order_by('-created_at')
+                .values_list('id', flat=True).first()
+            )
+            self.checked_at = now
+        return self.active_id
+
+    def active(self):
+        """The active model, loaded from disk only if it is not cached. None
+        if there is none."""
+        model_id = self.active_stamp()
+        if model_id is None:
+            return None
+        return self.get(model_id)
+
+    def get(self, model_id):
+        with self.lock:
+            loaded = self.models.get(model_id)
+            if loaded is not None:
+                self.models.move_to_end(model_id)
+                return loaded
+
+            model_obj = PredictionModel.objects.get(id=model_id)
+            loaded = self.load(model_obj)
+            logger.info(
+                f"Loaded model {loaded.label} "
+                f"({type(loaded.model).__name__}) into the registry"
+            )
+
+            self.put(loaded)
+            return loaded
+
+    @staticmethod
+    def load(model_obj):
+        path = compiled_path(model_obj.file_path)
+        mmap_mode = 'r' if settings.MODEL_MMAP else None
+        if settings.MODEL_COMPILE and os.path.isdir(path):
+            model, scaler = load_artifact(path, mmap_mode)
+            return LoadedModel(model_obj.id, str(model_obj), model, scaler)
+
+        model, scaler = artifact_model(joblib.load(model_obj.file_path))
+        if settings.MODEL_COMPILE:
+            # Written next to the artifact, so the other processes map the
+            # same files
+            try:
+                model = compile_artifact(
+                    model_obj.file_path, model, scaler, mmap_mode
+                )
+            except (ValueError, OSError) as e:
+                logger.warning(
+                    f"Serving model {model_obj} as an estimator: {e}"
+                )
+        return LoadedModel(model_obj.id, str(model_obj), model, scaler)
+
+    def put(self, loaded):
+        self.models[loaded.id] = loaded
+        self.models.move_to_end(loaded.id)
+        while len(self.models) > self.size:
+            self.models.popitem(last=False)
+
+    def activate(self, loaded):
+        """Record a model this process just activated, so it is served
+        without reloading it."""
+        with self.lock:
+            self.put(loaded)
+            self.active_id = loaded.id
+            self.checked_at = time.monotonic()
+
+    def clear(self):
+        with self.lock:
+            self.models.clear()
+            self.active_id = None
+            self.checked_at = None
+
+
+# Shared by every ModelService of the process
+model_registry = ModelRegistry()
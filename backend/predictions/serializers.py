@@ -1,6 +1,7 @@
 from rest_framework import serializers
 
-from .models import ModelTrainingHistory, Prediction, PredictionModel
+from .models import (ModelTrainingHistory, Prediction, PredictionModel,
+                     TrainingJob)
 
 
 class PredictionModelSerializer(serializers.ModelSerializer):
@@ -33,6 +34,14 @@ class ModelTrainingHistorySerializer(serializers.ModelSerializer):
         read_only_fields = ('id', 'created_at')
 
 
+class TrainingJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = TrainingJob
+        fields = ('id', 'days', 'requested_by', 'status', 'history', 'error',
+                  'created_at', 'started_at', 'finished_at')
+        read_only_fields = fields
+
+
 class PredictionRequestSerializer(serializers.Serializer):
     location = serializers.CharField(required=True)
     hours_ahead = serializers.IntegerField(default=24, min_value=1, max_value=168)  # 1 hour to 7 days
@@ -7,6 +7,8 @@ import numpy as np
 import pandas as pd
 import requests
 from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max
 from django.utils import timezone
 from loguru import logger
 from sklearn.ensemble import RandomForestRegressor
@@ -14,11 +16,14 @@ from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
 from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import StandardScaler
 
-from data_collection.models import ProcessedData
+from data_collection.features import FEATURE_COLUMNS, fill_defaults, read_frame
+from data_collection.models import LatestLocationFeatures, LocationFeatures
 from users.models import User
 from users.services import send_pollution_alert_email
 
+from .compiled import compile_artifact
 from .models import ModelTrainingHistory, Prediction, PredictionModel
+from .registry import LoadedModel, model_registry
 
 
 class ModelService:
@@ -29,30 +34,57 @@ class ModelService:
         # Load the active model if available
         self.model = None
         self.scaler = None
+        self.model_id = None  # PredictionModel the loaded model comes from
+        self.model_label = None
         self.load_active_model()
+
+    @staticmethod
+    def compile_model_file(filepath, model, scaler=None):
+        """Compile a saved model next to its file. Returns the model to serve:
+        the compiled one, or the estimator itself if it cannot be compiled."""
+        if not settings.MODEL_COMPILE:
+            return model
+        try:
+            mmap_mode = 'r' if settings.MODEL_MMAP else None
+            return compile_artifact(filepath, model, scaler, mmap_mode)
+        except Exception as e:
+            logger.warning(
+                f"Could not compile model {filepath}, serving the estimator: "
+                f"{e}"
+            )
+            return model
+
+    def use_model(self, loaded):
+        """Swap in a registry model; model and scaler always change
+        together."""
+        self.model, self.scaler, self.model_id, self.model_label = (
+            loaded.model, loaded.scaler, loaded.id, loaded.label
+        )
+
+    def refresh_model(self):
+        """Switch to the active model if another process activated a new one.
+
+        The registry checks the active model at most every
+        MODEL_REFRESH_INTERVAL seconds. The new model is fully loaded before
+        it replaces the current one, so inference goes on with the previous
+        model until then.
+        """
+        loaded = model_registry.active()
+        if loaded is not None and loaded.id != self.model_id:
+            logger.info(f"Active model changed to {loaded.label}")
+            self.use_model(loaded)
     
     def load_active_model(self):
-        """Load the currently active model."""
+        """Load the currently active model, from the process registry when
+        it is cached."""
         try:
-            model_obj = PredictionModel.objects.filter(is_active=True).latest('created_at')
-            model_path = model_obj.file_path
-            
-            # Check if model file exists
-            if not os.path.exists(model_path):
-                logger.error(f"Model file not found: {model_path}")
+            loaded = model_registry.active()
+            if loaded is None:
+                logger.warning("No active model found")
                 self.download_remote_model()
                 return
-            
-            # Load model and scaler
-            model_data = joblib.load(model_path)
-            self.model = model_data.get('model')
-            self.scaler = model_data.get('scaler')
-            
-            logger.info(f"Loaded active model: {model_obj.name} v{model_obj.version}")
-            
-        except PredictionModel.DoesNotExist:
-            logger.warning("No active model found")
-            self.download_remote_model()
+
+            self.use_model(loaded)
         
         except Exception as e:
             logger.error(f"Error loading active model: {e}")
@@ -86,24 +118,28 @@ class ModelService:
                 f.write(response.content)
 
             # Load the model (assumed to be an XGBRegressor instance)
-            model = joblib.load(filepath)
-
-            # Create model record in the database
-            model_obj = PredictionModel.objects.create(
-                name='remote_model',
-                version=timezone.now().strftime('%Y%m%d%H%M%S'),
-                file_path=filepath,
-                metrics={},  # Optionnel : tu peux calculer les métriques plus tard
-                is_active=True,
-                is_remote=True
-            )
-
-            # Deactivate other models
-            PredictionModel.objects.exclude(id=model_obj.id).update(is_active=False)
+            model = self.compile_model_file(filepath, joblib.load(filepath))
+
+            # Create model record in the database and deactivate the other
+            # models together
+            with transaction.atomic():
+                model_obj = PredictionModel.objects.create(
+                    name='remote_model',
+                    version=timezone.now().strftime('%Y%m%d%H%M%S'),
+                    file_path=filepath,
+                    # Optionnel : tu peux calculer les métriques plus tard
+                    metrics={},
+                    is_active=True,
+                    is_remote=True
+                )
+                PredictionModel.objects.exclude(id=model_obj.id).update(
+                    is_active=False
+                )
 
             # Set model and scaler (None in this case)
-            self.model = model
-            self.scaler = None
+            loaded = LoadedModel(model_obj.id, str(model_obj), model)
+            model_registry.activate(loaded)
+            self.use_model(loaded)
 
             logger.info(f"Downloaded and activated remote model: {model_obj.name} v{model_obj.version}")
             return True
@@ -138,43 +174,87 @@ class ModelService:
             return df
         
         elif location:
-            # Get the latest processed data for the location
-            try:
-                latest_data = ProcessedData.objects.filter(location=location).latest('timestamp')
-                
-                # Extract data
-                weather = latest_data.data.get('weather', {})
-                pollution = latest_data.data.get('pollution', {})
-                
-                data = {
-                    'temperature': weather.get('temperature', 20),
-                    'humidity': weather.get('humidity', 50),
-                    'wind_speed': weather.get('wind_speed', 5),
-                    'pressure': weather.get('pressure', 1013),
-                    'cloud_cover': weather.get('clouds', 0),
-                    'pm25': pollution.get('pm25', 10),
-                    'pm10': pollution.get('pm10', 20),
-                    'o3': pollution.get('o3', 30),
-                    'no2': pollution.get('no2', 10),
-                    'so2': pollution.get('so2', 5),
-                    'co': pollution.get('co', 0.5),
-                    'location': location,
-                    'latitude': latest_data.latitude,
-                    'longitude': latest_data.longitude,
-                }
-                
-                # Create DataFrame
-                df = pd.DataFrame([data])
-                return df
-                
-            except ProcessedData.DoesNotExist:
+            # Get the latest features of the location from the feature store
+            latest = (
+                LatestLocationFeatures.objects.filter(location=location)
+                .values_list('latitude', 'longitude', *FEATURE_COLUMNS).first()
+            )
+            if latest is None:
                 logger.error(f"No processed data found for location: {location}")
                 return None
+
+            latitude, longitude, *values = latest
+            features = fill_defaults(np.array([values], dtype=float))
+
+            # Create DataFrame
+            df = pd.DataFrame(features, columns=FEATURE_COLUMNS)
+            df['location'] = location
+            df['latitude'] = latitude
+            df['longitude'] = longitude
+            return df
         
         return None
     
+    def model_features(self, features):
+        """Turn rows of FEATURE_COLUMNS into the active model's input.
+
+        Locally trained models come with the scaler they were trained with;
+        the remote model has none and is scored on the first features,
+        unscaled.
+        """
+        features = np.asarray(features, dtype=float)
+        if self.scaler is not None:
+            return self.scaler.transform(features)
+        return features[:, :getattr(self.model, 'n_features_in_', 7)]
+
+    def predict_frame(self, features, locations, latitudes, longitudes,
+                      hours_ahead=24):
+        """Score a feature frame with one predict call and store its
+        predictions in bulk.
+
+        ``features`` has one row per location in FEATURE_COLUMNS order.
+        Returns the created Prediction objects.
+        """
+        if not self.model:
+            logger.error("Model not available")
+            self.load_active_model()
+            if not self.model:
+                return []
+
+        if not len(locations):
+            return []
+
+        predictions = self.model.predict(self.model_features(features))
+
+        now = timezone.now()
+        prediction_time = now + timedelta(hours=hours_ahead)
+        pred_objs = Prediction.objects.bulk_create([
+            Prediction(
+                model_id=self.model_id,
+                input_data=dict(zip(FEATURE_COLUMNS, row)),
+                output_data={'prediction': float(prediction)},
+                location=location,
+                latitude=latitude,
+                longitude=longitude,
+                timestamp=now,
+                prediction_time=prediction_time
+            )
+            for row, prediction, location, latitude, longitude in zip(
+                np.asarray(features).tolist(), predictions, locations,
+                latitudes, longitudes
+            )
+        ])
+
+        # Check if predictions exceed user thresholds and send alerts
+        users = list(User.objects.filter(receive_alerts=True))
+        for pred_obj in pred_objs:
+            self.check_and_send_alerts(pred_obj, users)
+
+        return pred_objs
+
     def make_prediction(self, location, hours_ahead=24):
-        """Make a prediction for a specific location."""
+        """Make a prediction for a specific location from its latest
+        processed data (API calls)."""
         if not self.model:
             logger.error("Model or scaler not available")
             self.load_active_model()
@@ -203,13 +283,10 @@ class ModelService:
 
         # Make prediction
         try:
-            # Get current model
-            model_obj = PredictionModel.objects.filter(is_active=True).latest('created_at')
-            
             # Get prediction time
             prediction_time = timezone.now() + timedelta(hours=hours_ahead)
 
-            feat =[scaled_features[0][:7]]
+            feat = self.model_features(scaled_features[:1])
 
             logger.info(f"voilà feat: {feat}")
 
@@ -218,7 +295,7 @@ class ModelService:
             
             # Create prediction object
             pred_obj = Prediction.objects.create(
-                model=model_obj,
+                model_id=self.model_id,
                 input_data=df.to_dict(orient='records')[0],
                 output_data={'prediction': float(prediction)},
                 location=loc_info['location'],
@@ -237,7 +314,7 @@ class ModelService:
                 'location': loc_info['location'],
                 'timestamp': timezone.now().isoformat(),
                 'prediction_time': prediction_time.isoformat(),
-                'model': f"{model_obj.name} v{model_obj.version}"
+                'model': self.model_label
             }
             
         except Exception as e:
@@ -272,15 +349,12 @@ class ModelService:
         
         # Make prediction
         try:
-            # Get current model
-            model_obj = PredictionModel.objects.filter(is_active=True).latest('created_at')
-            
             # Make prediction
             prediction = self.model.predict(scaled_features)[0]
             
             # Create prediction object
             pred_obj = Prediction.objects.create(
-                model=model_obj,
+                model_id=self.model_id,
                 input_data=df.to_dict(orient='records')[0],
                 output_data={'prediction': float(prediction)},
                 location=loc_info['location'],
@@ -298,21 +372,22 @@ class ModelService:
                 'prediction': float(prediction),
                 'location': loc_info['location'],
                 'timestamp': timezone.now().isoformat(),
-                'model': f"{model_obj.name} v{model_obj.version}"
+                'model': self.model_label
             }
             
         except Exception as e:
             logger.error(f"Error making custom prediction: {e}")
             return None
     
-    def check_and_send_alerts(self, prediction):
+    def check_and_send_alerts(self, prediction, users=None):
         """Check if prediction exceeds thresholds and send alerts to users."""
         try:
             # Get prediction value
             pred_value = prediction.output_data.get('prediction', 0)
             
             # Get users who want alerts
-            users = User.objects.filter(receive_alerts=True)
+            if users is None:
+                users = User.objects.filter(receive_alerts=True)
             
             for user in users:
                 # Check if prediction exceeds user's threshold
@@ -341,54 +416,37 @@ class ModelService:
         cutoff_date = timezone.now() - timedelta(days=days)
         
         try:
-            # Get processed data
-            data = ProcessedData.objects.filter(timestamp__gte=cutoff_date)
+            # Get feature rows from the feature store
+            data = LocationFeatures.objects.filter(timestamp__gte=cutoff_date)
             
-            if data.count() < 100:  # Need enough data for training
-                logger.warning(f"Not enough data for training: {data.count()} records")
+            # Size the arrays once; rows stored meanwhile are left for the
+            # next training
+            stats = data.aggregate(count=Count('pk'), last_id=Max('pk'))
+            if stats['count'] < 100:  # Need enough data for training
+                logger.warning(
+                    f"Not enough data for training: {stats['count']} records"
+                )
                 return None
             
-            # Prepare features and target
-            records = []
-            
-            for item in data:
-                try:
-                    # Extract weather and pollution data
-                    weather = item.data.get('weather', {})
-                    pollution = item.data.get('pollution', {})
-                    
-                    # Create record
-                    record = {
-                        'temperature': weather.get('temperature', 20),
-                        'humidity': weather.get('humidity', 50),
-                        'wind_speed': weather.get('wind_speed', 5),
-                        'pressure': weather.get('pressure', 1013),
-                        'cloud_cover': weather.get('clouds', 0),
-                        'pm25': pollution.get('pm25', 10),
-                        'pm10': pollution.get('pm10', 20),
-                        'o3': pollution.get('o3', 30),
-                        'no2': pollution.get('no2', 10),
-                        'so2': pollution.get('so2', 5),
-                        'co': pollution.get('co', 0.5),
-                        # Target is typically one of the pollution values
-                        # Here we'll use pm25 as an example
-                        'target': pollution.get('pm25', 10),
-                    }
-                    
-                    records.append(record)
-                    
-                except Exception as e:
-                    logger.error(f"Error processing data record: {e}")
-            
-            if not records:
-                logger.warning("No valid records for training")
-                return None
+            # Stream the columns through a server-side cursor into a
+            # preallocated float32 array (the precision the trees split on)
+            chunk_size = settings.TRAINING_CHUNK_SIZE
+            rows = (
+                data.filter(pk__lte=stats['last_id'])
+                .values_list(*FEATURE_COLUMNS)
+                .iterator(chunk_size=chunk_size)
+            )
+            features = read_frame(rows, stats['count'], chunk_size)
+
+            # Missing readings (NULL) get their default value
+            features = fill_defaults(features)
             
             # Create DataFrame
-            df = pd.DataFrame(records)
+            df = pd.DataFrame(features, columns=FEATURE_COLUMNS)
             
-            # Handle missing values
-            df = df.fillna(method='ffill').fillna(method='bfill').fillna(0)
+            # Target is typically one of the pollution values
+            # Here we'll use pm25 as an example
+            df['target'] = df['pm25']
             
             return df
             
@@ -468,29 +526,43 @@ class ModelService:
         filename = f"model_{uuid.uuid4().hex}.joblib"
         filepath = os.path.join(self.model_dir, filename)
 
-        # Save model
+        # Save model, and its compiled arrays before other processes can load
+        # it
         joblib.dump(model_data, filepath)
+        served_model = self.compile_model_file(filepath, model, scaler)
 
-        # Create model record
-        model_obj = PredictionModel.objects.create(
-            name='local_model',
-            version=timezone.now().strftime('%Y%m%d%H%M%S'),
-            file_path=filepath,
-            metrics=metrics_after,
-            is_active=should_update,
-            is_remote=False
-        )
-
-        # If new model is better, set it as active
-        if should_update:
-            # Deactivate other models
-            PredictionModel.objects.exclude(id=model_obj.id).update(is_active=False)
+        # Create model record; when it is better, activate it and deactivate
+        # the other models in one transaction, so there is always one active
+        # model
+        with transaction.atomic():
+            model_obj = PredictionModel.objects.create(
+                name='local_model',
+                version=timezone.now().strftime('%Y%m%d%H%M%S'),
+                file_path=filepath,
+                metrics=metrics_after,
+                is_active=should_update,
+                is_remote=False
+            )
 
-            # Update instance variables
-            self.model = model
-            self.scaler = scaler
+            if should_update:
+                PredictionModel.objects.exclude(id=model_obj.id).update(
+                    is_active=False
+                )
 
-            logger.info(f"Activated new model with {improvement:.2f}% improvement")
+        # If new model is better, use it
+        if should_update:
+            loaded = LoadedModel(
+                model_obj.id, str(model_obj), served_model, scaler
+            )
+            model_registry.activate(loaded)
+            self.use_model(loaded)
+
+            if improvement is None:
+                logger.info("Activated new model")
+            else:
+                logger.info(
+                    f"Activated new model with {improvement:.2f}% improvement"
+                )
 
         # Create training history record
         history = ModelTrainingHistory.objects.create(
@@ -0,0 +1,89 @@
+from datetime import timedelta
+
+import numpy as np
+import pytest
+import xgboost as xgb
+from django.utils import timezone
+from sklearn.ensemble import RandomForestRegressor
+
+from predictions.compiled import CompiledForest, compile_model
+from predictions.models import TrainingJob
+from predictions.training import TrainingWorker
+
+
+@pytest.mark.django_db
+def test_abandoned_training_jobs_are_requeued_then_failed(settings):
+    settings.TRAINING_JOB_TIMEOUT = 60
+    settings.TRAINING_JOB_MAX_ATTEMPTS = 2
+    stale = timezone.now() - timedelta(seconds=120)
+    first = TrainingJob.objects.create(
+        status='running', started_at=stale, heartbeat_at=stale, attempts=1
+    )
+    last = TrainingJob.objects.create(
+        status='running', started_at=stale, heartbeat_at=stale, attempts=2
+    )
+    alive = TrainingJob.objects.create(
+        status='running', started_at=stale, heartbeat_at=timezone.now(),
+        attempts=1
+    )
+
+    TrainingWorker().recover_stale_jobs()
+
+    first.refresh_from_db()
+    last.refresh_from_db()
+    alive.refresh_from_db()
+    assert first.status == 'pending'
+    assert first.heartbeat_at is None
+    assert last.status == 'failed'
+    assert alive.status == 'running'
+
+    claimed = TrainingWorker().claim_job()
+    assert claimed.pk == first.pk
+    assert claimed.attempts == 2
+
+
+@pytest.fixture
+def regression_data():
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(1000, 11))
+    y = X[:, 0] * 3 + np.sin(X[:, 1]) + rng.normal(size=1000) * 0.1
+    return X, y, rng.normal(size=(200, 11))
+
+
+def test_compiled_forest_matches_random_forest(regression_data):
+    X, y, X_test = regression_data
+    forest = RandomForestRegressor(n_estimators=20, random_state=42)
+    forest.fit(X, y)
+
+    compiled = compile_model(forest)
+    np.testing.assert_allclose(
+        compiled.predict(X_test), forest.predict(X_test), atol=1e-5
+    )
+
+
+def test_compiled_forest_matches_xgboost_with_missing_values(
+        regression_data):
+    X, y, X_test = regression_data
+    X[::7, 2] = np.nan
+    X_test[::3, 2] = np.nan
+    model = xgb.XGBRegressor(n_estimators=50, max_depth=6)
+    model.fit(X, y)
+
+    compiled = compile_model(model)
+    np.testing.assert_allclose(
+        compiled.predict(X_test), model.predict(X_test), atol=1e-4
+    )
+
+
+def test_compiled_forest_memory_mapped_round_trip(regression_data,
+                                                  tmp_path):
+    X, y, X_test = regression_data
+    forest = RandomForestRegressor(n_estimators=5, random_state=42)
+    compiled = compile_model(forest.fit(X, y))
+
+    compiled.save(tmp_path / 'model.compiled')
+    loaded = CompiledForest.load(tmp_path / 'model.compiled', mmap_mode='r')
+    assert isinstance(loaded.feature, np.memmap)
+    np.testing.assert_array_equal(
+        loaded.predict(X_test), compiled.predict(X_test)
+    )
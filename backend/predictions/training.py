@@ -0,0 +1,149 @@
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from loguru import logger
+
+from .models import TrainingJob
+from .services import ModelService
+
+
+def enqueue_training(days=30, requested_by='manual'):
+    """Queue a training job for the training worker. Returns the job.
+
+    A job already waiting with the same number of days is reused.
+    """
+    job = TrainingJob.objects.filter(
+        status='pending', days=days
+    ).order_by('created_at').first()
+    if job:
+        return job
+
+    job = TrainingJob.objects.create(days=days, requested_by=requested_by)
+    logger.info(
+        f"Queued training job {job.id} on {days} days of data "
+        f"({requested_by})"
+    )
+    return job
+
+
+class TrainingWorker:
+    """
+    Runs queued training jobs one at a time, away from the prediction
+    consumer. A model activated by a job is picked up by the running
+    consumers and API workers on their next refresh.
+    """
+
+    def __init__(self):
+        self.poll_interval = settings.TRAINING_POLL_INTERVAL
+        self.heartbeat_interval = settings.TRAINING_HEARTBEAT_INTERVAL
+        self.job_timeout = settings.TRAINING_JOB_TIMEOUT
+        self.max_attempts = settings.TRAINING_JOB_MAX_ATTEMPTS
+
+    def recover_stale_jobs(self):
+        """Requeue the running jobs whose worker stopped sending heartbeats,
+        or fail them once they used all their attempts."""
+        cutoff = timezone.now() - timedelta(seconds=self.job_timeout)
+        stale = TrainingJob.objects.filter(status='running').filter(
+            Q(heartbeat_at__lt=cutoff)
+            | Q(heartbeat_at__isnull=True, started_at__lt=cutoff)
+        )
+
+        failed = stale.filter(attempts__gte=self.max_attempts).update(
+            status='failed',
+            error='Training worker stopped responding',
+            finished_at=timezone.now()
+        )
+        requeued = stale.update(
+            status='pending', started_at=None, heartbeat_at=None
+        )
+        if failed or requeued:
+            logger.warning(
+                f"Recovered abandoned training jobs: {requeued} requeued, "
+                f"{failed} failed"
+            )
+
+    def claim_job(self):
+        """Mark the oldest pending job as running and return it, None if
+        there is none."""
+        # Skip jobs locked by another worker
+        with transaction.atomic():
+            job = (
+                TrainingJob.objects.select_for_update(skip_locked=True)
+                .filter(status='pending')
+                .order_by('created_at')
+                .first()
+            )
+            if job is None:
+                return None
+
+            job.status = 'running'
+            job.started_at = job.heartbeat_at = timezone.now()
+            job.attempts += 1
+            job.save(update_fields=[
+                'status', 'started_at', 'heartbeat_at', 'attempts'
+            ])
+        return job
+
+    def heartbeat(self, job, stop):
+        """Refresh the heartbeat of a running job until stop is set."""
+        try:
+            while not stop.wait(self.heartbeat_interval):
+                TrainingJob.objects.filter(
+                    pk=job.pk, status='running'
+                ).update(heartbeat_at=timezone.now())
+        except Exception as e:
+            logger.error(f"Heartbeat of training job {job.id} failed: {e}")
+        finally:
+            connection.close()
+
+    def run_job(self, job):
+        logger.info(
+            f"Running training job {job.id} on {job.days} days of data"
+        )
+        stop = threading.Event()
+        heartbeat = threading.Thread(
+            target=self.heartbeat, args=(job, stop), daemon=True
+        )
+        heartbeat.start()
+        try:
+            history = ModelService().train_model(job.days)
+        except Exception as e:
+            logger.error(f"Training job {job.id} failed: {e}")
+            job.status = 'failed'
+            job.error = str(e)
+        else:
+            if history is None:
+                job.status = 'failed'
+                job.error = 'Not enough data for training'
+            else:
+                job.status = 'succeeded'
+                job.history = history
+        finally:
+            stop.set()
+            heartbeat.join()
+
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'error', 'history', 'finished_at'])
+        logger.info(f"Training job {job.id} {job.status}")
+
+    def run(self):
+        logger.info("Starting training worker")
+
+        while True:
+            try:
+                self.recover_stale_jobs()
+                job = self.claim_job()
+                if job is None:
+                    time.sleep(self.poll_interval)
+                    continue
+
+                self.run_job(job)
+
+            except Exception as e:
+                logger.error(f"Error in training worker: {e}")
+                time.sleep(self.poll_interval)
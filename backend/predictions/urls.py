@@ -4,7 +4,8 @@ from .views import (ActiveModelDetailView, CustomPredictionView,
                     ForceModelDownloadView, ForceModelUpdateView,
                     GetPredictionView, ManualModelTrainingView,
                     ModelEvaluationView, ModelTrainingHistoryListView,
-                    PredictionListView, PredictionModelListView)
+                    PredictionListView, PredictionModelListView,
+                    TrainingJobDetailView)
 
 urlpatterns = [
     path('models/', PredictionModelListView.as_view(), name='model-list'),
@@ -14,6 +15,8 @@ urlpatterns = [
     path('custom/', CustomPredictionView.as_view(), name='custom-prediction'),
     path('training/history/', ModelTrainingHistoryListView.as_view(), name='training-history'),
     path('training/manual/', ManualModelTrainingView.as_view(), name='manual-training'),
+    path('training/jobs/<int:pk>/', TrainingJobDetailView.as_view(),
+         name='training-job'),
     path('evaluation/', ModelEvaluationView.as_view(), name='model-evaluation'),
     path('models/update-remote/', ForceModelUpdateView.as_view(), name='update-remote-model'),
     path('models/download-remote/', ForceModelDownloadView.as_view(), name='download-remote-model'),
@@ -7,12 +7,15 @@ from rest_framework.views import APIView
 
 from users.permissions import IsAdminUser
 
-from .models import ModelTrainingHistory, Prediction, PredictionModel
+from .models import (ModelTrainingHistory, Prediction, PredictionModel,
+                     TrainingJob)
 from .serializers import (CustomPredictionRequestSerializer,
                           ModelTrainingHistorySerializer,
-                          PredictionModelSerializer, PredictionRequestSerializer,
-                          PredictionSerializer)
+                          PredictionModelSerializer,
+                          PredictionRequestSerializer, PredictionSerializer,
+                          TrainingJobSerializer)
 from .services import ModelService
+from .training import enqueue_training
 
 
 class PredictionModelListView(generics.ListAPIView):
@@ -132,13 +135,19 @@ class ManualModelTrainingView(APIView):
         if days < 1:
             return Response({"error": "Days must be a positive number"}, status=status.HTTP_400_BAD_REQUEST)
         
-        model_service = ModelService()
-        result = model_service.train_model(days)
-        
-        if result:
-            return Response({"message": "Model training initiated", "training_id": result.id})
-        else:
-            return Response({"error": "Could not initiate model training"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        # Trained by the training worker
+        job = enqueue_training(days, requested_by='manual')
+        return Response(
+            {"message": "Model training initiated", "job_id": job.id},
+            status=status.HTTP_202_ACCEPTED
+        )
+
+
+class TrainingJobDetailView(generics.RetrieveAPIView):
+    """Status of a training job, as returned by the manual training view."""
+    queryset = TrainingJob.objects.all()
+    serializer_class = TrainingJobSerializer
+    permission_classes = [IsAdminUser]
 
 
 class ModelEvaluationView(APIView):